@@ -9,10 +9,12 @@ from functools import partial
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 mpl.rcParams['figure.figsize'] = (8, 3)
-mpl.rcParams['figure.subplot.bottom'] = 0.15 
+mpl.rcParams['figure.subplot.bottom'] = 0.15
 mpl.rcParams['font.size'] = 8
 
-from qcodes.utils.configreader import Config
+from lazy_imports import lazy_import
+
+from configreader import Config
 from qcodes.utils.wrappers import show_num
 
 from majorana_wrappers import *
@@ -28,24 +30,26 @@ from qcodes.instrument_drivers.Keysight.Keysight_34465A import Keysight_34465A
 from qcodes.instrument_drivers.ZI.ZIUHFLI import ZIUHFLI
 from qcodes.instrument_drivers.devices import VoltageDivider
 
-import qcodes.instrument_drivers.tektronix.Keithley_2600 as keith
 import qcodes.instrument_drivers.rohde_schwarz.SGS100A as sg
 import qcodes.instrument_drivers.tektronix.AWG5014 as awg
-from modules.pulsebuilding import broadbean as bb
 from qcodes.instrument_drivers.oxford.mercuryiPS import MercuryiPS
-import qcodes.instrument_drivers.HP .HP8133A as hpsg
-import qcodes.instrument_drivers.rohde_schwarz.ZNB as vna
+import qcodes.instrument_drivers.HP.HP8133A as hpsg
+
+# Modules not used at startup are only imported on first use. Run
+# startup_benchmark.py to see what imports cost.
+keith = lazy_import('qcodes.instrument_drivers.tektronix.Keithley_2600')
+bb = lazy_import('modules.pulsebuilding.broadbean')
+vna = lazy_import('qcodes.instrument_drivers.rohde_schwarz.ZNB')
 
-from qcodes.utils.configreader import Config
 from qcodes.utils.validators import Numbers
-import logging
-import re
-import time
-from functools import partial
 import atexit
 
 from conductance_measurements import do2Dconductance
 from fast_diagrams import fast_charge_diagram
+from config_watcher import ConfigWatcher
+from station_builder import build_station, close_station
+from snapshot_cache import SnapshotCache
+from collections import OrderedDict
 
 if __name__ == '__main__':
 
@@ -56,55 +60,74 @@ if __name__ == '__main__':
     # import T10_setup as t10
     config = Config('A:\qcodes_experiments\modules\Majorana\sample.config')
 
-    def close_station(station):
-        for comp in station.components:
-            print("Closing connection to {}".format(comp))
-            try:
-                qc.Instrument.find_instrument(comp).close()
-            except KeyError:
-                pass
-
-
     if qc.Station.default:
         close_station(qc.Station.default)
 
     # Initialisation of intruments
-    qdac = QDAC_T10('qdac', 'ASRL8::INSTR', config, update_currents=False)
-    lockin_topo = SR830_T10('lockin_topo', 'GPIB10::7::INSTR')
-    lockin_left = SR830_T10('lockin_l', 'GPIB10::10::INSTR')
-    lockin_right = SR830_T10('lockin_r', 'GPIB10::14::INSTR')
-    zi = ZIUHFLI_T10('ziuhfli', 'dev2189')
-    keysightgen_left = Keysight_33500B('keysight_gen_left', 'TCPIP0::192.168.15.101::inst0::INSTR')
+    # The instruments are opened and queried concurrently, so the startup
+    # time is set by the slowest instrument. Parameter values are taken
+    # from the snapshot cache of the last session, except for the gate
+    # voltages, the lock-in settings that SR830_T10 and the sweep planner
+    # read from the cache (amplitude, display, time constant, filter slope)
+    # and any value older than a day.
+    snapshot_cache = SnapshotCache('A:\qcodes_experiments\modules\Majorana\station_snapshot.json',
+                                   max_age=24*3600,
+                                   volatile=['qdac_chan*_v',
+                                             'lockin*_amplitude',
+                                             'lockin*_ch1_display',
+                                             'lockin*_time_constant',
+                                             'lockin*_filter_slope'])
+    start = time.time()
+    STATION, startup_report = build_station(OrderedDict([
+        ('qdac', partial(QDAC_T10, 'qdac', 'ASRL8::INSTR', config,
+                         update_currents=False)),
+        ('lockin_topo', partial(SR830_T10, 'lockin_topo', 'GPIB10::7::INSTR')),
+        ('lockin_r', partial(SR830_T10, 'lockin_r', 'GPIB10::14::INSTR')),
+        ('lockin_l', partial(SR830_T10, 'lockin_l', 'GPIB10::10::INSTR')),
+        ('keysight_gen_left', partial(Keysight_33500B, 'keysight_gen_left',
+                                      'TCPIP0::192.168.15.101::inst0::INSTR')),
+        ('keysight_gen_mid', partial(Keysight_33500B, 'keysight_gen_mid',
+                                     'TCPIP0::192.168.15.114::inst0::INSTR')),
+        # ('keithley_bot', partial(keith.Keithley_2600, 'keithley_bot', 'TCPIP0::192.168.15.115::inst0::INSTR', "a")),
+        # ('keysight_dmm_top', partial(Keysight_34465A_T10, 'keysight_dmm_top', 'TCPIP0::192.168.15.111::inst0::INSTR')),
+        ('keysight_dmm_mid', partial(Keysight_34465A_T10, 'keysight_dmm_mid',
+                                     'TCPIP0::192.168.15.112::inst0::INSTR')),
+        ('keysight_dmm_bot', partial(Keysight_34465A_T10, 'keysight_dmm_bot',
+                                     'TCPIP0::192.168.15.113::inst0::INSTR')),
+        ('AWG1', partial(awg.Tektronix_AWG5014, 'AWG1',
+                         'TCPIP0::192.168.15.105::inst0::INSTR', timeout=40)),
+        ('AWG2', partial(awg.Tektronix_AWG5014, 'AWG2',
+                         'TCPIP0::192.168.15.106::inst0::INSTR', timeout=180)),
+        ('ziuhfli', partial(ZIUHFLI_T10, 'ziuhfli', 'dev2189')),
+        ('mercury', partial(MercuryiPS, name='mercury',
+                            address='192.168.15.102',
+                            port=7020,
+                            axes=['X', 'Y', 'Z'])),
+        ('sg1', partial(sg.RohdeSchwarz_SGS100A, "sg1",
+                        "TCPIP0::192.168.15.107::inst0::INSTR")),
+        ('hpsg1', partial(hpsg.HP8133A, "hpsg1", 'GPIB10::4::INSTR')),
+        # ('keysight_gen_pulse', partial(Keysight_33500B, 'keysight_gen_pulse', 'TCPIP0::192.168.15.109::inst0::INSTR')),
+        # ('VNA', partial(vna.ZNB20, 'VNA', 'TCPIP0::192.168.15.108::inst0::INSTR')),
+        ]), timeouts={'AWG2': 180}, snapshot_cache=snapshot_cache)
+
+    qdac = STATION['qdac']
+    lockin_topo = STATION['lockin_topo']
+    lockin_left = STATION['lockin_l']
+    lockin_right = STATION['lockin_r']
+    # The conductance of all three lock-ins with pipelined GPIB reads
+    lockins = LockinGroup('lockins', [lockin_topo, lockin_left, lockin_right])
+    zi = STATION['ziuhfli']
+    keysightgen_left = STATION['keysight_gen_left']
     keysightgen_left.add_function('sync_phase',call_cmd='SOURce1:PHASe:SYNChronize')
-    keysightgen_mid = Keysight_33500B('keysight_gen_mid', 'TCPIP0::192.168.15.114::inst0::INSTR')
-    #keysightdmm_top = Keysight_34465A_T10('keysight_dmm_top', 'TCPIP0::192.168.15.111::inst0::INSTR')
-    keysightdmm_mid = Keysight_34465A_T10('keysight_dmm_mid', 'TCPIP0::192.168.15.112::inst0::INSTR')
-    keysightdmm_bot = Keysight_34465A_T10('keysight_dmm_bot','TCPIP0::192.168.15.113::inst0::INSTR')
-    #keithleybot_a = keith.Keithley_2600('keithley_bot','TCPIP0::192.168.15.115::inst0::INSTR',"a")
-    awg1 = awg.Tektronix_AWG5014('AWG1','TCPIP0::192.168.15.105::inst0::INSTR',timeout=40)
-    awg2 = awg.Tektronix_AWG5014('AWG2','TCPIP0::192.168.15.106::inst0::INSTR',timeout=180)
-    sg1 = sg.RohdeSchwarz_SGS100A("sg1","TCPIP0::192.168.15.107::inst0::INSTR")
+    keysightgen_mid = STATION['keysight_gen_mid']
+    keysightdmm_mid = STATION['keysight_dmm_mid']
+    keysightdmm_bot = STATION['keysight_dmm_bot']
+    awg1 = STATION['AWG1']
+    awg2 = STATION['AWG2']
+    sg1 = STATION['sg1']
     sg1.frequency.set_validator(Numbers(1e5,43.5e9))  # SMF100A can go to 43.5 GHz.
-    hpsg1 = hpsg.HP8133A("hpsg1", 'GPIB10::4::INSTR')  
-  #  keysightgen_pulse = Keysight_33500B('keysight_gen_pulse', 'TCPIP0::192.168.15.109::inst0::INSTR')
-    mercury = MercuryiPS(name='mercury',
-                         address='192.168.15.102',
-                         port=7020,
-                         axes=['X', 'Y', 'Z'])
-
-   # v1 = vna.ZNB20('VNA', 'TCPIP0::192.168.15.108::inst0::INSTR')
-   # keithleytop=keith.Keithley_2600('keithley_top',
-   # 'TCPIP0::192.168.15.116::inst0::INSTR',"a,b")
-   
-    print('Querying all instrument parameters for metadata.'
-          'This may take a while...')
-
-    start = time.time()
-    STATION = qc.Station(qdac, lockin_topo, lockin_right, lockin_left,
-                         keysightgen_left, keysightgen_mid,# keithleybot_a,
-                         keysightdmm_mid, keysightdmm_bot,
-                         # keysightdmm_top, keysightdmm_mid, keysightdmm_bot,
-                         awg1, awg2, zi, mercury, sg1, hpsg1)# keysightgen_pulse)
+    hpsg1 = STATION['hpsg1']
+    mercury = STATION['mercury']
 
     end = time.time()
     print("Querying took {} s".format(end-start))
@@ -133,6 +156,10 @@ if __name__ == '__main__':
     reload_SR830_settings()
     reload_QDAC_settings()
 
+    # From now on, edits of the config file are pushed to the instruments
+    config_watcher = ConfigWatcher(config)
+    config_watcher.start()
+
 # setup fast diagrams
 #    zi.oscillator1_freq(278e6)
 #    zi.oscillator2_freq(275e6)
@@ -156,3 +183,6 @@ if __name__ == '__main__':
  
     # Try to close all instruments when exiting
     atexit.register(close_station, STATION)
+    # atexit runs last-in-first-out, so the values of this session are
+    # cached before the instruments are closed
+    atexit.register(snapshot_cache.save, STATION)
@@ -7,15 +7,21 @@ from qcodes.instrument_drivers.Keysight.Keysight_33500B import Keysight_33500B
 from qcodes.instrument_drivers.Keysight.Keysight_34465A import Keysight_34465A
 from qcodes.instrument_drivers.ZI.ZIUHFLI import ZIUHFLI
 from qcodes.instrument_drivers.devices import VoltageDivider
-from qcodes.instrument_drivers.oxford.mercuryiPS import MercuryiPS
 
-from qcodes.utils.configreader import Config
+from configreader import Config
+
+from lazy_imports import lazy_import, lazy_from
 
 import qcodes.instrument_drivers.tektronix.Keithley_2600 as keith
-import qcodes.instrument_drivers.rohde_schwarz.SGS100A as sg
-import qcodes.instrument_drivers.tektronix.AWG5014 as awg
-import qcodes.instrument_drivers.HP.HP8133A as hpsg
-import qcodes.instrument_drivers.rohde_schwarz.ZNB as vna
+
+# The drivers not used at startup are only imported on first use. Run
+# startup_benchmark.py to see what imports cost.
+sg = lazy_import('qcodes.instrument_drivers.rohde_schwarz.SGS100A')
+awg = lazy_import('qcodes.instrument_drivers.tektronix.AWG5014')
+hpsg = lazy_import('qcodes.instrument_drivers.HP.HP8133A')
+vna = lazy_import('qcodes.instrument_drivers.rohde_schwarz.ZNB')
+MercuryiPS = lazy_from('qcodes.instrument_drivers.oxford.mercuryiPS',
+                       'MercuryiPS')
 
 import logging
 import re
@@ -30,6 +36,9 @@ import atexit
 
 from conductance_measurements import do2Dconductance
 from fast_diagrams import fast_charge_diagram 
+from station_builder import build_station, close_station
+from snapshot_cache import SnapshotCache
+from collections import OrderedDict
 
 import matplotlib as mpl
 import matplotlib.pyplot as plt
@@ -45,53 +54,65 @@ if __name__ == '__main__':
     # config = Config('C:\Users\Jens\Majorana\sample.config')
     config = Config('../Majorana/sample.config')
 
-    def close_station(station):
-        for comp in station.components:
-            print("Closing connection to {}".format(comp))
-            try:
-                qc.Instrument.find_instrument(comp).close()
-            except KeyError:
-                pass
-
     if qc.Station.default:
         close_station(qc.Station.default)
 
     # Initialisation of intruments
-    qdac = QDAC_T10('qdac', 'ASRL6::INSTR', config, update_currents=False)
-    lockin = SR830_T10('lockin_topo', 'GPIB0::8::INSTR')
-    zi = ZIUHFLI_T10('ziuhfli', 'dev2235')
-    keysightgen_left = Keysight_33500B('keysight_gen_left',
-                                    'TCPIP0::192.168.15.108::inst0::INSTR')
-    keysightgen_left.add_function('sync_phase',call_cmd='SOURce1:PHASe:SYNChronize')
-    keysightgen_2 = Keysight_33500B('keysight_gen_2',
-                                    'TCPIP0::192.168.15.112::inst0::INSTR')
-    keysightdmm_1 = Keysight_34465A_T10('keysight_dmm_top',
-                                        'TCPIP0::192.168.15.110::inst0::INSTR')
-    keysightdmm_2 = Keysight_34465A_T10('keysight_dmm_2',
-                                        'TCPIP0::192.168.15.115::inst0::INSTR')
-    keysightdmm_3 = Keysight_34465A_T10('keysight_dmm_3',
-                                        'TCPIP0::192.168.15.117::inst0::INSTR')
-    keithley_1 = keith.Keithley_2600('keithley_1',
-                                     'TCPIP0::192.168.15.114::inst0::INSTR',
-                                     "a")
-    keithley_2 = keith.Keithley_2600('keithley_2',
-                                     'TCPIP0::192.168.15.116::inst0::INSTR',
-                                     "a")
-
-    print('Querying all instrument parameters for metadata.'
-          'This may take a while...')
-
+    # The instruments are opened and queried concurrently, so the startup
+    # time is set by the slowest instrument. Parameter values are taken
+    # from the snapshot cache of the last session, except for the gate
+    # voltages, the lock-in settings that SR830_T10 and the sweep planner
+    # read from the cache (amplitude, display, time constant, filter slope)
+    # and any value older than a day.
+    snapshot_cache = SnapshotCache('../Majorana/station_snapshot.json',
+                                   max_age=24*3600,
+                                   volatile=['qdac_chan*_v',
+                                             'lockin*_amplitude',
+                                             'lockin*_ch1_display',
+                                             'lockin*_time_constant',
+                                             'lockin*_filter_slope'])
     start = time.time()
-    STATION = qc.Station(qdac, lockin, zi, 
-                         keysightgen_left, keysightgen_2,
-                         keysightdmm_1, keysightdmm_2, keysightdmm_3,
-                         keithley_1, keithley_2)
+    STATION, startup_report = build_station(OrderedDict([
+        ('qdac', partial(QDAC_T10, 'qdac', 'ASRL6::INSTR', config,
+                         update_currents=False)),
+        ('lockin_topo', partial(SR830_T10, 'lockin_topo', 'GPIB0::8::INSTR')),
+        ('ziuhfli', partial(ZIUHFLI_T10, 'ziuhfli', 'dev2235')),
+        ('keysight_gen_left', partial(Keysight_33500B, 'keysight_gen_left',
+                                      'TCPIP0::192.168.15.108::inst0::INSTR')),
+        ('keysight_gen_2', partial(Keysight_33500B, 'keysight_gen_2',
+                                   'TCPIP0::192.168.15.112::inst0::INSTR')),
+        ('keysight_dmm_top', partial(Keysight_34465A_T10, 'keysight_dmm_top',
+                                     'TCPIP0::192.168.15.110::inst0::INSTR')),
+        ('keysight_dmm_2', partial(Keysight_34465A_T10, 'keysight_dmm_2',
+                                   'TCPIP0::192.168.15.115::inst0::INSTR')),
+        ('keysight_dmm_3', partial(Keysight_34465A_T10, 'keysight_dmm_3',
+                                   'TCPIP0::192.168.15.117::inst0::INSTR')),
+        ('keithley_1', partial(keith.Keithley_2600, 'keithley_1',
+                               'TCPIP0::192.168.15.114::inst0::INSTR', "a")),
+        ('keithley_2', partial(keith.Keithley_2600, 'keithley_2',
+                               'TCPIP0::192.168.15.116::inst0::INSTR', "a")),
+        ]), snapshot_cache=snapshot_cache)
+
+    qdac = STATION['qdac']
+    lockin = STATION['lockin_topo']
+    zi = STATION['ziuhfli']
+    keysightgen_left = STATION['keysight_gen_left']
+    keysightgen_left.add_function('sync_phase',call_cmd='SOURce1:PHASe:SYNChronize')
+    keysightgen_2 = STATION['keysight_gen_2']
+    keysightdmm_1 = STATION['keysight_dmm_top']
+    keysightdmm_2 = STATION['keysight_dmm_2']
+    keysightdmm_3 = STATION['keysight_dmm_3']
+    keithley_1 = STATION['keithley_1']
+    keithley_2 = STATION['keithley_2']
 
     end = time.time()
     print("Querying took {} s".format(end-start))
 
     # Try to close all instruments when exiting
     atexit.register(close_station, STATION)
+    # atexit runs last-in-first-out, so the values of this session are
+    # cached before the instruments are closed
+    atexit.register(snapshot_cache.save, STATION)
 
     # Initialisation of the experiment
     qc.init("./MajoQubit", "DVZ_MCQ002A1", STATION, annotate_image=False, 
@@ -0,0 +1,95 @@
+# Script comparing the ASCII (TRCA) and binary (TRCB) readout of the SR830
+# data buffer
+#
+# Usage: python buffer_benchmark.py [address]
+#
+# With an address, e.g. GPIB10::7::INSTR, the real lock-in is used and its
+# buffer is filled at 512 Hz, which takes half a minute for the largest
+# size. Without, a simulated lock-in with a GPIB-like throughput is used.
+import sys
+import time
+
+import numpy as np
+
+# Buffer sizes (points)
+DEFAULT_SIZES = [100, 300, 1000, 3000, 10000, 16383]
+
+# Throughput of the simulated GPIB bus (bytes/s)
+SIMULATED_THROUGHPUT = 100e3
+
+
+def fill_buffer(lockin, npts):
+    """
+    Fill the buffer with npts points sampled at 512 Hz
+    """
+    lockin.buffer_pause()
+    lockin.buffer_reset()
+    lockin.buffer_acq_mode('Single shot')
+    lockin.buffer_SR(512)
+    lockin.buffer_start()
+    while lockin.buffer_npts() < npts:
+        time.sleep(0.1)
+    lockin.buffer_pause()
+
+
+def readout_time(lockin, npts, transfer, repetitions=3):
+    """
+    The fastest of a few readouts of npts points
+
+    Returns:
+        Tuple[float, numpy.ndarray]: The time (s) and the data
+    """
+    times = []
+    for _ in range(repetitions):
+        t0 = time.perf_counter()
+        data = lockin.conductance.read_buffer(npts, transfer)
+        times.append(time.perf_counter() - t0)
+
+    return min(times), data
+
+
+def benchmark(lockin, sizes=DEFAULT_SIZES):
+    """
+    Print a table of the readout time of both transfers for every size
+
+    Returns:
+        dict: The (ascii, binary) readout times (s) of each size
+    """
+    times = {}
+    print('{:>6}  {:>9}  {:>9}  {:>7}'.format('points', 'ascii', 'binary',
+                                              'speedup'))
+    for npts in sizes:
+        fill_buffer(lockin, npts)
+        t_ascii, ascii = readout_time(lockin, npts, 'ascii')
+        t_binary, binary = readout_time(lockin, npts, 'binary')
+
+        # The ASCII transfer has fewer digits than the floats
+        if not np.allclose(ascii, binary, rtol=1e-5, atol=0):
+            print('Warning: the transfers disagree for {} points'.format(npts))
+
+        times[npts] = (t_ascii, t_binary)
+        print('{:>6}  {:>7.3f} s  {:>7.3f} s  {:>6.1f}x'.format(
+            npts, t_ascii, t_binary, t_ascii/t_binary))
+
+    return times
+
+
+def _simulated_lockin():
+    from configreader import Config
+    from simulated_instruments import SimulatedDevice, SimSR830, SimQDac
+
+    config = Config('sample.config')
+
+    device = SimulatedDevice(seed=0)
+    device.qdac = SimQDac('qdac', config, latency=0)
+    return SimSR830('lockin_topo', device, latency=2e-3,
+                    throughput=SIMULATED_THROUGHPUT)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        from customised_instruments import SR830_T10
+        lockin = SR830_T10('lockin_topo', sys.argv[1])
+    else:
+        lockin = _simulated_lockin()
+    benchmark(lockin)
@@ -10,6 +10,8 @@ from qcodes.utils.wrappers import _do_measurement
 from qcodes.instrument_drivers.QDev.QDac_channels import QDac as QDacch
 
 from customised_instruments import SR830_T10
+from majorana_wrappers import _prepare_virtual_gates
+from hardware_sweeps import _hardware_sweep
 
 def do2Dconductance(outer_param: Parameter,
                     outer_start: Union[float, int],
@@ -20,7 +22,10 @@ def do2Dconductance(outer_param: Parameter,
                     inner_stop: Union[float, int],
                     inner_npts: int,
                     lockin: SR830_T10,
-                    delay: Optional[float]=None):
+                    delay: Optional[float]=None,
+                    snake: bool=False,
+                    internal_clock: bool=False,
+                    sync: Optional[int]=None):
     """
     Function to perform a sped-up 2D conductance measurement
 
@@ -36,6 +41,16 @@ def do2Dconductance(outer_param: Parameter,
         lockin: The lock-in amplifier to use
         delay: Delay to wait after setting inner parameter before triggering lockin.
           If None will use default delay, otherwise used the supplied.
+        snake: Sweep the inner parameter back and forth instead of always
+          from inner_start to inner_stop, which saves ramping back for
+          every row. The data are stored in the order of the setpoints.
+        internal_clock: Let the QDac ramp the inner parameter (a QDac
+          channel voltage) while the lock-in samples on its internal clock,
+          and read every row from the buffer in one go (see
+          hardware_sweeps.QDacRampSweep). The sample rate is the fastest
+          SR830 rate with at least delay between points.
+        sync: The QDac sync output wired to the lock-in trigger input, to
+          start the buffer with the ramp (internal_clock only)
     """
     station = qc.Station.default
 
@@ -58,6 +73,13 @@ def do2Dconductance(outer_param: Parameter,
     min_delay = 0.002  # what's the physics behind this number?
     if delay is None:
         delay = tau + min_delay
+
+    if internal_clock:
+        return _do2Dconductance_internal_clock(
+            outer_param, outer_start, outer_stop, outer_npts,
+            inner_param, inner_start, inner_stop, inner_npts,
+            sr, delay, snake, sync)
+
     # Prepare for the first iteration
     # Some of these things have to be repeated during the loop
     sr.buffer_reset()
@@ -94,18 +116,35 @@ def do2Dconductance(outer_param: Parameter,
     def reset_buffer():
         sr.buffer_reset()
 
+    def sweep_row():
+        # Every other row runs backwards, the buffer flips it back
+        values = np.linspace(inner_start, inner_stop, inner_npts)
+        if sr.conductance.reverse:
+            values = values[::-1]
+        for value in values:
+            inner_param.set(value)
+            trigger()
+
+    def flip_direction():
+        sr.conductance.reverse = not sr.conductance.reverse
+
     trig_task = qc.Task(trigger)
     reset_task = qc.Task(reset_buffer)
     start_task = qc.Task(start_buffer)
-    inner_loop = qc.Loop(inner_param.sweep(inner_start,
-                                           inner_stop,
-                                           num=inner_npts)).each(trig_task)
+    if snake:
+        inner_loop = qc.Task(sweep_row)
+        end_tasks = (reset_task, qc.Task(flip_direction))
+    else:
+        inner_loop = qc.Loop(inner_param.sweep(inner_start,
+                                               inner_stop,
+                                               num=inner_npts)).each(trig_task)
+        end_tasks = (reset_task,)
     outer_loop = qc.Loop(outer_param.sweep(outer_start,
                                            outer_stop,
                                            num=outer_npts)).each(start_task,
                                                                  inner_loop,
                                                                  sr.conductance,
-                                                                 reset_task)
+                                                                 *end_tasks)
 
     set_params = ((inner_param, inner_start, inner_stop),
                   (outer_param, outer_start, outer_stop))
@@ -120,9 +159,42 @@ def do2Dconductance(outer_param: Parameter,
     if isinstance(outer_param._instrument, QDacch):
         qdacch = outer_param._instrument
         qdacch.slope('Inf')
+    # Virtual gates are checked against the channel ranges for the whole
+    # scan before anything moves
+    _prepare_virtual_gates((outer_param, outer_start, outer_stop, outer_npts),
+                           (inner_param, inner_start, inner_stop, inner_npts))
     if qdac:
         qdac.fast_voltage_set(True)  # now that we have unbound the function generators
                                      # we don't need to do it in the loop
         qdac.voltage_set_dont_wait(False)  # this is un safe and highly experimental
-    plot, data = _do_measurement(outer_loop, set_params, meas_params, do_plots=True)
-    return plot, data
\ No newline at end of file
+    sr.conductance.reverse = False
+    try:
+        plot, data = _do_measurement(outer_loop, set_params, meas_params,
+                                     do_plots=True)
+    finally:
+        sr.conductance.reverse = False
+    return plot, data
+
+def _do2Dconductance_internal_clock(outer_param, outer_start, outer_stop,
+                                    outer_npts, inner_param, inner_start,
+                                    inner_stop, inner_npts, sr, delay, snake,
+                                    sync):
+    """
+    do2Dconductance with the rows acquired on the internal clock of the
+    lock-in, with no host work per point
+    """
+    sweep = _hardware_sweep(inner_param, inner_start, inner_stop, inner_npts,
+                            delay, sr.conductance, sync, snake)
+    outer_loop = qc.Loop(outer_param.sweep(outer_start,
+                                           outer_stop,
+                                           num=outer_npts)).each(sweep)
+
+    set_params = ((inner_param, inner_start, inner_stop),
+                  (outer_param, outer_start, outer_stop))
+    meas_params = (sweep,)
+
+    if isinstance(outer_param._instrument, QDacch):
+        outer_param._instrument.slope('Inf')
+    _prepare_virtual_gates((outer_param, outer_start, outer_stop, outer_npts))
+
+    return _do_measurement(outer_loop, set_params, meas_params, do_plots=True)
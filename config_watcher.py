@@ -0,0 +1,106 @@
+# Module watching the config file and pushing changes to the instruments
+import logging
+import os
+import threading
+
+from configreader import Config
+from reload_settings import apply_settings_changes
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+log = logging.getLogger(__name__)
+
+
+class ConfigWatcher(threading.Thread):
+    """
+    Background thread applying changes of the config file to the station.
+
+    Whenever the file changes, the old and new config snapshots are
+    compared and only the affected labels, validators and gain factors are
+    updated (see reload_settings.apply_settings_changes). Nothing is
+    updated while a Config.transaction is open.
+
+    File changes are detected with inotify if the inotify_simple package is
+    installed, otherwise the file is polled. Polling is cheap, since
+    Config.reload only parses the file when it has changed.
+
+    Args:
+        config (Optional[Config]): Default: the default Config object
+        station (Optional[Station]): Default: the default station at the
+            time of each update
+        interval (float): The polling interval (s). With inotify, this is
+            how often the thread checks whether it should stop.
+        use_inotify (bool): Use inotify if available. Default: True.
+    """
+
+    def __init__(self, config=None, station=None, interval=1.0,
+                 use_inotify=True):
+        super().__init__(name='ConfigWatcher', daemon=True)
+
+        self.config = config or Config.default
+        self.station = station
+        self.interval = interval
+        self.use_inotify = use_inotify and inotify_simple is not None
+
+        self._stop_event = threading.Event()
+
+    def run(self):
+        self.config.reload()
+        self._current = self.config.snapshot
+
+        if self.use_inotify:
+            self._watch_inotify()
+        else:
+            self._watch_polling()
+
+    def stop(self):
+        """
+        Stop the thread and wait for it to finish
+        """
+        self._stop_event.set()
+        self.join()
+
+    def _watch_polling(self):
+        while not self._stop_event.wait(self.interval):
+            self._update()
+
+    def _watch_inotify(self):
+        # Watch the folder rather than the file, since the file is replaced
+        # when written atomically (and by most editors)
+        path = os.path.abspath(self.config._filename)
+        folder, filename = os.path.split(path)
+
+        flags = inotify_simple.flags
+        inotify = inotify_simple.INotify()
+        inotify.add_watch(folder, flags.CLOSE_WRITE | flags.MOVED_TO |
+                          flags.CREATE)
+        try:
+            while not self._stop_event.is_set():
+                events = inotify.read(timeout=int(self.interval*1000))
+                if any(ev.name == filename for ev in events):
+                    self._update()
+        finally:
+            inotify.close()
+
+    def _update(self):
+        # The snapshot would include the uncommitted values of the open
+        # transaction, which may still be rolled back
+        if self.config.in_transaction:
+            return
+        try:
+            self.config.reload()
+            new = self.config.snapshot
+            if new is self._current:
+                return
+            applied = apply_settings_changes(self._current, new,
+                                             self.station)
+            self._current = new
+        except Exception:
+            log.exception('Could not apply config file changes')
+            return
+
+        for update in applied:
+            log.info('Config change applied: {}'.format(update))
@@ -1,5 +1,17 @@
 # Module containing the config file reader class
+import io
+import os
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
 from configparser import ConfigParser
+from types import MappingProxyType
+
+import numpy as np
+
+# The number of channels of the QDac
+QDAC_N_CHANNELS = 48
 
 
 class Config:
@@ -9,6 +21,18 @@ class Config:
     The ConfigFile is constantly synced with the config file on disk
     (provided that only this object was used to change the file).
 
+    Reloading is cheap when the file has not changed: the modification
+    time, size and content hash of the file are remembered, and the file
+    is only re-parsed when one of them differs from the last parse.
+
+    Several set() calls can be grouped with the transaction context
+    manager, in which case the file is written once, when the transaction
+    ends:
+
+        with config.transaction():
+            config.set('Gain settings', 'iv topo gain', 1e8)
+            config.set('Gain settings', 'ac factor topo', 1e4)
+
     Args:
         filename (str): The path to the configuration file on disk
         isdefault (Optional[bool]): Whether this is the default Config object.
@@ -17,6 +41,9 @@ class Config:
     Attributes:
         default (Union[None, Config]): A reference to the default Config
             object, if it exists. Else None.
+        cache_hits (int): The number of reloads that were skipped because
+            the file was unchanged
+        cache_misses (int): The number of times the file was parsed
     """
 
     default = None
@@ -30,17 +57,173 @@ class Config:
 
         self._filename = filename
         self._cfg = ConfigParser()
+        # (mtime_ns, size) of the file at the last parse and the hash of
+        # its content
+        self._stat = None
+        self._hash = None
+        self._snapshot = None
+        self._transaction_depth = 0
+        self._pending = False
+        # Guards against a file watcher thread reloading concurrently
+        self._lock = threading.RLock()
+
+        self.cache_hits = 0
+        self.cache_misses = 0
+
         self._load()
 
+    def _file_stat(self):
+        """
+        Return the (mtime_ns, size) tuple of the file or None if the file
+        can not be found
+        """
+        try:
+            st = os.stat(self._filename)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
     def _load(self):
-        self._cfg.read(self._filename)
+        with self._lock:
+            self._parse_if_changed()
+
+    def _parse_if_changed(self):
+        stat = self._file_stat()
+
+        if stat is not None and stat == self._stat:
+            self.cache_hits += 1
+            return
+
+        try:
+            with open(self._filename, 'rb') as configfile:
+                content = configfile.read()
+        except OSError:
+            # Mimic ConfigParser.read, which silently ignores missing files
+            self.cache_misses += 1
+            self._stat = None
+            self._hash = None
+            return
+
+        digest = hashlib.sha1(content).hexdigest()
+        self._stat = stat
+
+        # The file was touched, but its content is the same
+        if digest == self._hash:
+            self.cache_hits += 1
+            return
+
+        cfg = ConfigParser()
+        cfg.read_string(content.decode(), source=self._filename)
+        self._cfg = cfg
+        self._hash = digest
+        self._snapshot = None
+        self.cache_misses += 1
 
     def reload(self):
         """
-        Reload the file from disk.
+        Reload the file from disk. The file is only parsed if it has changed
+        since the last time it was read.
+
+        Inside a transaction this does nothing, so that reads keep seeing
+        the values that are pending to be written.
+        """
+        if self._transaction_depth > 0:
+            return
+        self._load()
+
+    @property
+    def in_transaction(self):
         """
+        Whether a transaction is open, i.e. whether the loaded values may
+        include uncommitted ones
+        """
+        return self._transaction_depth > 0
+
+    @contextmanager
+    def transaction(self):
+        """
+        Context manager collecting set() calls into a single write.
+
+        Reads inside the transaction see the pending values. The file is
+        written when the outermost transaction exits. If it exits with an
+        exception, the pending values are discarded and the file is
+        re-read from disk.
+        """
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self._discard_pending()
+            raise
+
+        self._transaction_depth -= 1
+        if self._transaction_depth == 0 and self._pending:
+            self._write()
+
+    def _discard_pending(self):
+        """
+        Drop values set during a failed transaction by re-parsing the file
+        """
+        if not self._pending:
+            return
+        self._pending = False
+        self._stat = None
+        self._hash = None
         self._load()
 
+    def _write(self):
+        """
+        Write the config to disk atomically, through a temporary file in
+        the same folder that is renamed onto the config file.
+        """
+        with self._lock:
+            self._write_file()
+
+    def _write_file(self):
+        buffer = io.StringIO()
+        self._cfg.write(buffer)
+        content = buffer.getvalue().encode()
+
+        folder = os.path.dirname(os.path.abspath(self._filename))
+        fd, tmpname = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmpfile:
+                tmpfile.write(content)
+                tmpfile.flush()
+                os.fsync(tmpfile.fileno())
+            # mkstemp creates the file readable by the owner only
+            if os.path.exists(self._filename):
+                os.chmod(tmpname, os.stat(self._filename).st_mode)
+            os.replace(tmpname, self._filename)
+        except BaseException:
+            os.remove(tmpname)
+            raise
+
+        # The parser is now in sync with the file, so there is no need to
+        # parse it again on the next reload
+        self._pending = False
+        self._hash = hashlib.sha1(content).hexdigest()
+        self._stat = self._file_stat()
+
+    @property
+    def snapshot(self):
+        """
+        The typed ConfigSnapshot of the currently loaded file. It is built
+        on first access after each (re)parse of the file.
+        """
+        if self._snapshot is None:
+            self._snapshot = ConfigSnapshot(self._cfg)
+        return self._snapshot
+
+    def reset_cache_stats(self):
+        """
+        Reset the cache hit/miss counters
+        """
+        self.cache_hits = 0
+        self.cache_misses = 0
+
     def get(self, section, field=None):
         """
         Gets the value of the specified section/field.
@@ -69,7 +252,7 @@ class Config:
     def set(self, section, field, value):
         """
         Set a value in the config file.
-        Immediately writes to disk.
+        Immediately writes to disk, unless called inside a transaction.
 
         Args:
             section (str): The name of the section to write to
@@ -80,6 +263,111 @@ class Config:
             value = '{}'.format(value)
 
         self._cfg[section][field] = value
+        self._snapshot = None
+        self._pending = True
+
+        if self._transaction_depth == 0:
+            self._write()
+
+
+class ConfigSnapshot:
+    """
+    An immutable, typed view of the T10 sections of a config file.
+
+    The snapshot is built once per version of the file (see
+    Config.snapshot), so that lookups are plain array indexing with no
+    string parsing. All channel-indexed arrays have QDAC_N_CHANNELS+1
+    entries and are indexed by the channel number; entry 0 is unused.
+
+    Args:
+        cfg (ConfigParser): The parsed config file
+
+    Attributes:
+        labels (numpy.ndarray): Channel label (str) or None if unlabelled
+        used (numpy.ndarray): Boolean mask of the labelled channels
+        used_channels (tuple): The labelled channel numbers, sorted
+        bias_channels (tuple): The bias channel numbers
+        ranges (numpy.ndarray): (min, max) voltage of each channel, NaN
+            where no range is configured
+        slopes (numpy.ndarray): Maximal ramp speed (V/s) of each channel,
+            NaN for unused channels
+        gains (Mapping): The 'Gain settings' section as floats
+    """
 
-        with open(self._filename, 'w') as configfile:
-            self._cfg.write(configfile)
\ No newline at end of file
+    def __init__(self, cfg):
+
+        n = QDAC_N_CHANNELS + 1
+
+        labels = np.full(n, None, dtype=object)
+        used = np.zeros(n, dtype=bool)
+        if cfg.has_section('QDac Channel Labels'):
+            for key, label in cfg['QDac Channel Labels'].items():
+                chan = int(key)
+                if 1 <= chan <= QDAC_N_CHANNELS:
+                    labels[chan] = label
+                    used[chan] = True
+
+        bias_channels = ()
+        if cfg.has_option('Channel Parameters', 'topo bias channel'):
+            bias_channels = (int(cfg['Channel Parameters']
+                                 ['topo bias channel']),)
+
+        # NB: This is the voltage AT the QDac, BEFORE voltage dividers
+        ranges = np.full((n, 2), np.nan)
+        if cfg.has_section('Channel ranges'):
+            for key, chan_range in cfg['Channel ranges'].items():
+                chan = int(key)
+                if not 1 <= chan <= QDAC_N_CHANNELS:
+                    continue
+                minmax = chan_range.split()
+                if len(minmax) != 2:
+                    raise ValueError("Expected: min max. "
+                                     "Got {}".format(chan_range))
+                ranges[chan] = (float(minmax[0]), float(minmax[1]))
+
+        slopes = np.full(n, np.nan)
+        if cfg.has_section('Ramp speeds'):
+            speeds = cfg['Ramp speeds']
+            slopes[used] = float(speeds['max rampspeed qdac'])
+            for chan in bias_channels:
+                slopes[chan] = float(speeds['max rampspeed bias'])
+
+        gains = {}
+        if cfg.has_section('Gain settings'):
+            gains = {key: float(val)
+                     for key, val in cfg['Gain settings'].items()}
+
+        for arr in (labels, used, ranges, slopes):
+            arr.setflags(write=False)
+
+        attrs = {'labels': labels,
+                 'used': used,
+                 'used_channels': tuple(int(ch) for ch in np.flatnonzero(used)),
+                 'bias_channels': bias_channels,
+                 'ranges': ranges,
+                 'slopes': slopes,
+                 'gains': MappingProxyType(gains)}
+        for key, val in attrs.items():
+            object.__setattr__(self, key, val)
+
+    def __setattr__(self, key, value):
+        raise AttributeError('ConfigSnapshot is immutable')
+
+    def channel_labels(self):
+        """
+        Return a dict with channel number (int) as keys and labels as values
+        """
+        return {ch: self.labels[ch] for ch in self.used_channels}
+
+    def slope(self, channel):
+        """
+        Return the maximal ramp speed (V/s) of a channel.
+
+        Raises:
+            KeyError: If no slope is configured for the channel
+        """
+        slope = self.slopes[channel]
+        if np.isnan(slope):
+            raise KeyError('No slope configured for channel '
+                           '{}'.format(channel))
+        return float(slope)
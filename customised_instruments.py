@@ -3,6 +3,9 @@
 Customised instruments with extra features such as voltage dividers and derived
 parameters for use with T10
 """
+import threading
+from typing import Optional
+
 import numpy as np
 
 from qcodes.instrument_drivers.QDev.QDac_channels import QDac
@@ -12,6 +15,14 @@ from qcodes.instrument_drivers.Keysight.Keysight_34465A import Keysight_34465A
 from qcodes.instrument_drivers.devices import VoltageDivider
 from qcodes.instrument_drivers.ZI.ZIUHFLI import ZIUHFLI
 from qcodes import ArrayParameter
+from qcodes.instrument.parameter import MultiParameter
+
+# The output range of the QDac (V)
+QDAC_MAX_VOLTAGE = 10
+# The QDac takes voltages with six decimals (V)
+QDAC_VOLTAGE_RESOLUTION = 1e-6
+# The QDac function generator refuses ramps shorter than this (s)
+QDAC_MIN_RAMP_TIME = 0.002
 
 class Scope_avg(ArrayParameter):
 
@@ -61,27 +72,204 @@ class ConductanceBuffer(ChannelBuffer):
     array of X measurements
 
     We basically just slightly tweak the get method
+
+    The buffer is read with the binary TRCB transfer (IEEE floats) instead
+    of the ASCII one, which is several times faster on GPIB for long rows.
+    Set transfer to 'ascii' to use TRCA.
+
+    If reverse is set, the buffer was filled in the opposite order of the
+    setpoints (e.g. in a serpentine scan) and the data are flipped.
+
+    The number of points is taken from the shape, without asking the
+    SR830 how many it has stored. A missed trigger therefore shows up as a
+    VISA timeout or a short read (which raises), and an extra trigger goes
+    unnoticed and shifts the data against the setpoints. Set check_npts to
+    query the number of stored points before every read, at the cost of
+    one more transaction.
     """
 
     def __init__(self, name: str, instrument: 'SR830_T10', **kwargs):
         super().__init__(name, instrument, channel=1)
         self.unit = ('e^2/h')
+        self.reverse = False
+        self.transfer = 'binary'
+        self.check_npts = False
+
+    def read_buffer(self, npts: int, transfer: Optional[str]=None):
+        """
+        Read the first npts points of the channel buffer
+
+        Args:
+            npts: The number of points
+            transfer: 'binary' (TRCB) or 'ascii' (TRCA). Default: the
+                transfer attribute
+
+        Returns:
+            numpy.ndarray: The buffer data
+
+        Raises:
+            ValueError: If the SR830 returns fewer than npts points
+        """
+        transfer = transfer or self.transfer
+        sr = self._instrument
+
+        if transfer == 'binary':
+            sr.write('TRCB ? {}, 0, {}'.format(self.channel, npts))
+            rawdata = sr.visa_handle.read_raw()
+            received = len(rawdata)//4
+            if received >= npts:
+                # Four bytes per point, decoded without copying
+                return np.frombuffer(rawdata, dtype='<f4', count=npts)
+        elif transfer == 'ascii':
+            rawdata = sr.ask('TRCA ? {}, 0, {}'.format(self.channel, npts))
+            data = np.array(rawdata.strip().rstrip(',').split(','),
+                            dtype=float)
+            received = len(data)
+            if received >= npts:
+                return data[:npts]
+        else:
+            raise ValueError('Unknown transfer: {}'.format(transfer))
+
+        raise ValueError('SR830 returned {} points from its buffer, expected '
+                         '{}'.format(received, npts))
 
     def get(self):
+        sr = self._instrument
+
         # If X is not being measured, complain
-        if self._instrument.ch1_display() != 'X':
+        if sr.cached(sr.ch1_display) != 'X':
             raise ValueError('Can not return conductance since X is not '
                              'being measured on channel 1.')
 
+        if not sr._buffer1_ready:
+            raise RuntimeError('Buffer not ready. Please run '
+                               'prepare_buffer_readout')
+
+        # The number of points is known from prepare_buffer_readout (or set
+        # by the measurement), so only the data are transferred
+        if self.check_npts:
+            npts = sr.buffer_npts()
+            if npts != self.shape[0]:
+                raise ValueError('SR830 got {} points in buffer, expected '
+                                 '{}'.format(npts, self.shape[0]))
+
         resistance_quantum = 25.818e3  # (Ohm)
-        xarray = super().get()
-        iv_conv = self._instrument.ivgain
-        ac_excitation = self._instrument.amplitude_true()
+        xarray = self.read_buffer(self.shape[0])
+        iv_conv = sr.ivgain
+        ac_excitation = sr.excitation()
 
         gs = xarray/iv_conv/ac_excitation*resistance_quantum
 
+        if self.reverse:
+            gs = gs[::-1]
+
         return gs
 
+# The fields of the SR830_T10 snap parameter
+SNAP_DTYPE = np.dtype([('X', float), ('Y', float), ('R', float),
+                       ('P', float), ('g', float)])
+
+
+class SnapParameter(MultiParameter):
+    """
+    X, Y, R, the phase and the conductance from a single SNAP query, i.e.
+    one GPIB transaction for all of them
+
+    Returns a numpy.record with the fields of SNAP_DTYPE. Being a sequence,
+    it can be measured in loops (do1d_M, do2d_M, ...) like any
+    MultiParameter.
+    """
+
+    def __init__(self, name: str, instrument: 'SR830_T10', **kwargs):
+        prefix = instrument.name
+        # full_names adds the instrument name, e.g. lockin_topo_X
+        super().__init__(name,
+                         names=SNAP_DTYPE.names,
+                         shapes=((),)*len(SNAP_DTYPE),
+                         labels=('X', 'Y', 'R', 'Phase',
+                                 '{} conductance'.format(prefix)),
+                         units=('V', 'V', 'V', 'deg', 'e^2/h'),
+                         instrument=instrument, **kwargs)
+
+    def get(self):
+        sr = self._instrument
+        x, y, r, p = (float(val) for val in
+                      sr.ask('SNAP ? 1, 2, 3, 4').split(','))
+
+        resistance_quantum = 25.818e3  # (Ohm)
+        g = x/sr.ivgain/sr.excitation()*resistance_quantum
+
+        return np.rec.fromrecords([(x, y, r, p, g)], dtype=SNAP_DTYPE)[0]
+
+class LockinGroup(MultiParameter):
+    """
+    The conductance (or the SNAP quantities) of several SR830_T10 lock-ins,
+    e.g. lockin_topo, lockin_l and lockin_r, measured together.
+
+    The transactions are pipelined: the query is sent to every lock-in
+    before any reply is read. The lock-ins therefore sample at almost the
+    same time and prepare their replies in parallel, and adding a lock-in
+    only adds the transfer of its reply instead of a whole round-trip.
+
+    No trigger is sent: the SR830 trigger (TRIG) only starts or advances
+    the data buffer, whereas OUTP and SNAP take the outputs at the moment
+    the query arrives. The queries themselves, sent back to back, are what
+    triggers the lock-ins together.
+
+    The group belongs to an instrument, by default the first lock-in, as
+    the measurement wrappers (do1d, do1d_M, ...) name the arrays after the
+    instrument of every parameter, e.g. lockin_topo_lockin_l_g.
+
+    Args:
+        name (str): The parameter name
+        lockins (Sequence[SR830_T10]): The lock-ins
+        snap (bool): Measure X, Y, R, the phase and the conductance of
+            every lock-in (see SnapParameter) instead of the conductance
+        instrument (Optional[Instrument]): Default: the first lock-in
+    """
+
+    def __init__(self, name: str, lockins, snap: bool=False,
+                 instrument=None, **kwargs):
+        self.lockins = list(lockins)
+        self.snap = snap
+        if instrument is None:
+            instrument = self.lockins[0]
+
+        fields = SNAP_DTYPE.names if snap else ('g',)
+        units = dict(X='V', Y='V', R='V', P='deg', g='e^2/h')
+        names, labels = [], []
+        for sr in self.lockins:
+            for field in fields:
+                names.append('{}_{}'.format(sr.name, field))
+                labels.append('{} {}'.format(sr.name, field))
+
+        super().__init__(name, names=tuple(names),
+                         shapes=((),)*len(names),
+                         labels=tuple(labels),
+                         units=tuple(units[field] for field in fields) *
+                         len(self.lockins),
+                         instrument=instrument, **kwargs)
+
+    def get(self):
+        cmd = 'SNAP ? 1, 2, 3, 4' if self.snap else 'OUTP ? 1'
+
+        for sr in self.lockins:
+            sr.write(cmd)
+        # The replies are read without writing again, as in
+        # ConductanceBuffer.read_buffer
+        replies = [sr.visa_handle.read() for sr in self.lockins]
+
+        resistance_quantum = 25.818e3  # (Ohm)
+        values = []
+        for sr, reply in zip(self.lockins, replies):
+            numbers = [float(val) for val in reply.split(',')]
+            g = numbers[0]/sr.ivgain/sr.excitation()*resistance_quantum
+            if self.snap:
+                values.extend(numbers)
+            values.append(g)
+
+        return tuple(values)
+
 # Subclass the SR830
 
 class SR830_T10(SR830):
@@ -90,11 +278,17 @@ class SR830_T10(SR830):
         - a Voltage divider
         - An I/V converter
         - A conductance buffer
+        - X, Y, R, phase and conductance from a single query (snap)
     """
 
     def __init__(self, name, address, **kwargs):
         super().__init__(name, address, **kwargs)
+        self._add_t10_parameters()
 
+    def _add_t10_parameters(self):
+        """
+        Add the T10 parameters on top of the SR830 ones
+        """
         # using the vocabulary of the config file
         self.ivgain = 1
         self.__acf = 1
@@ -115,6 +309,8 @@ class SR830_T10(SR830):
                            label='{} conductance'.format(self.name),
                            parameter_class=ConductanceBuffer)
 
+        self.add_parameter('snap', parameter_class=SnapParameter)
+
     def _get_conductance(self):
         """
         get_cmd for conductance parameter
@@ -122,10 +318,33 @@ class SR830_T10(SR830):
         resistance_quantum = 25.818e3  # (Ohm)
         i = self.X() / self.ivgain
         # ac excitation voltage at the sample
-        v_sample = self.amplitude_true()
+        v_sample = self.excitation()
 
         return (i/v_sample)*resistance_quantum
 
+    @staticmethod
+    def cached(param):
+        """
+        The cached value of a parameter, which is only queried if it has
+        never been set or read. The cache is updated whenever the parameter
+        is set or read, so changes made on the front panel are only seen
+        after an explicit get. The SR830 parameters used this way
+        (amplitude and ch1_display, and time_constant and filter_slope in
+        sweep_planner) must be volatile in the snapshot cache, see the init
+        scripts.
+        """
+        value = param.get_latest()
+        if value is None:
+            value = param.get()
+        return value
+
+    def excitation(self):
+        """
+        The ac excitation voltage at the sample, from the cached amplitude
+        and the ac factor. Does not query the instrument.
+        """
+        return self.cached(self.amplitude)/self.acfactor
+
     @property
     def acfactor(self):
         return self.__acf
@@ -142,14 +361,48 @@ class SR830_T10(SR830):
 class QDAC_T10(QDac):
     """
     A QDac with three voltage dividers
+
+    All communication holds io_lock, so that commands from several threads
+    (e.g. the audit of reload_settings) do not interleave on the serial
+    link, where the replies would get out of step with the commands.
     """
     def __init__(self, name, address, config, **kwargs):
+        # The driver talks to the QDac during its __init__
+        self.io_lock = threading.RLock()
         super().__init__(name, address, **kwargs)
+        self._add_t10_parameters(config)
+
+    def write(self, cmd):
+        with self.io_lock:
+            super().write(cmd)
+
+    def read(self):
+        with self.io_lock:
+            return super().read()
+
+    def ask_raw(self, cmd):
+        with self.io_lock:
+            return super().ask_raw(cmd)
+
+    def _get_status(self, readcurrents=False):
+        # The reply spans one line per channel
+        with self.io_lock:
+            return super()._get_status(readcurrents=readcurrents)
 
+    def _add_t10_parameters(self, config):
+        """
+        Add the named channels and voltage dividers defined in the config
+        """
         # Define the named channels
 
-        topo_channel = int(config.get('Channel Parameters',
-                                      'topo bias channel'))
+        settings = config.snapshot
+
+        # (min, max) voltage of each channel, updated from the config file
+        # by reload_QDAC_settings. Used by set_voltages.
+        self.ranges = np.tile([-QDAC_MAX_VOLTAGE, QDAC_MAX_VOLTAGE],
+                              (len(self.channels)+1, 1))
+
+        topo_channel = settings.bias_channels[0]
         topo_channel = self.channels[topo_channel-1].v
 
         self.add_parameter('current_bias',
@@ -169,8 +422,7 @@ class QDAC_T10(QDac):
         # sens_l_channel = self.channels[sens_l_channel-1].v
 
         self.topo_bias = VoltageDivider(topo_channel,
-                                        float(config.get('Gain settings',
-                                                         'dc factor topo')))
+                                        settings.gains['dc factor topo'])
         # self.sens_r_bias = VoltageDivider(sens_r_channel,
         #                                  float(config.get('Gain settings',
         #                                                   'dc factor right')))
@@ -178,6 +430,150 @@ class QDAC_T10(QDac):
         #                                  float(config.get('Gain settings',
         #                                                    'dc factor left')))
 
+    def get_voltages(self):
+        """
+        Read the voltages of all channels with a single status query,
+        instead of one query per channel.
+
+        Returns:
+            numpy.ndarray: The voltages indexed by channel number (entry 0
+                is NaN)
+        """
+        # The status query updates the cached value of every channel
+        self._get_status()
+
+        voltages = np.full(len(self.channels)+1, np.nan)
+        voltages[1:] = np.array([ch.v.get_latest() for ch in self.channels],
+                                dtype=float)
+
+        return voltages
+
+    def set_voltages(self, voltages):
+        """
+        Set the voltages of several channels at once.
+
+        All values are validated against the channel ranges before
+        anything is sent. Channels whose cached voltage already equals the
+        new value are skipped. The remaining channels without a slope (and
+        in the high voltage range) are set with one pipelined burst of
+        commands, i.e. all commands are sent before any reply is read. The
+        others go through their v parameter, e.g. to ramp.
+
+        Args:
+            voltages (dict): The voltage of each channel number
+
+        Returns:
+            list: The channels that were written to
+        """
+        if not voltages:
+            return []
+
+        chans = np.array(list(voltages), dtype=int)
+        values = np.array([voltages[ch] for ch in chans], dtype=float)
+
+        if ((chans < 1) | (chans > len(self.channels))).any():
+            raise ValueError('Invalid QDac channel(s) in '
+                             '{}'.format(sorted(voltages)))
+        low, high = self.ranges[chans].T
+        invalid = ~((values >= low) & (values <= high))
+        if invalid.any():
+            raise ValueError('Voltage(s) outside the channel range: ' +
+                             ', '.join('ch {}: {} V not in [{}, {}]'.format(
+                                 ch, v, lo, hi) for ch, v, lo, hi in zip(
+                                     chans[invalid], values[invalid],
+                                     low[invalid], high[invalid])))
+
+        cached = np.array([self.channels[ch-1].v.get_latest() for ch in chans],
+                          dtype=float)
+        # NaN (never read) compares False and is always written
+        changed = ~(np.abs(cached - values) < QDAC_VOLTAGE_RESOLUTION)
+
+        burst = []
+        with self.io_lock:
+            for ch, value in zip(chans[changed], values[changed]):
+                chan = self.channels[ch-1]
+                if (chan.slope.get() == 'Inf' and
+                        chan.vrange.get_latest() == 0):
+                    burst.append((ch, chan, value))
+                else:
+                    chan.v.set(value)
+
+            if burst:
+                self._write_pipelined(['set {} {:.6f}'.format(ch, value)
+                                       for ch, chan, value in burst])
+                for ch, chan, value in burst:
+                    chan.v._save_val(value)
+
+        return [int(ch) for ch in chans[changed]]
+
+    def ramp_voltages(self, targets, slopes, start=None):
+        """
+        Start ramps of several channels at once.
+
+        Setting v with a slope assigned makes the driver query the status
+        before starting the ramp, so ramping channels one by one starts
+        them one status query apart. Here the start voltages are read once
+        (or given), every value is validated, and then the ramps are
+        started with back-to-back commands, so the channels move together.
+        Moves shorter than QDAC_MIN_RAMP_TIME are set directly.
+
+        The slopes stay assigned; unassign them (slope 'Inf') once the
+        ramps are done.
+
+        Args:
+            targets (dict): The target voltage of each channel number
+            slopes (dict): The slope (V/s) of each channel number
+            start (Optional[dict]): The present voltage of each channel
+                number. Default: read with get_voltages
+
+        Returns:
+            float: The duration of the longest ramp (s)
+        """
+        if len(targets) > len(self._fgs):
+            raise ValueError('The QDac can only ramp {} channels at a time, '
+                             'not {}'.format(len(self._fgs), len(targets)))
+        for ch, value in targets.items():
+            self.channels[ch-1].v.validate(value)
+            self.channels[ch-1].slope.validate(slopes[ch])
+
+        ramp_time = 0
+        with self.io_lock:
+            if start is None:
+                voltages = self.get_voltages()
+                start = {ch: float(voltages[ch]) for ch in targets}
+
+            for ch, value in targets.items():
+                chan = self.channels[ch-1]
+                chan.slope.set(slopes[ch])
+                duration = abs(value - start[ch])/slopes[ch]
+
+                # As in the driver's _set_voltage, without its status query
+                self._assigned_fgs.pop(ch, None)
+                if duration > QDAC_MIN_RAMP_TIME:
+                    fg = min(self._fgs.difference(
+                        self._assigned_fgs.values()))
+                    self._assigned_fgs[ch] = fg
+                    self._rampvoltage(ch, fg, start[ch], value, duration)
+                else:
+                    atten = 10 if chan.vrange.get_latest() == 1 else 1
+                    self.write('wav {} 0 0 0;set {} {:.6f}'.format(
+                        ch, ch, value*atten))
+                chan.v._save_val(value)
+                ramp_time = max(ramp_time, duration)
+
+        return ramp_time
+
+    def _write_pipelined(self, commands):
+        """
+        Send commands without waiting for the reply of each one, then read
+        all replies (the QDac replies even to set commands)
+        """
+        with self.io_lock:
+            for cmd in commands:
+                self.visa_handle.write(cmd)
+            for cmd in commands:
+                self.visa_handle.read()
+
 
 # Subclass the DMM
 
@@ -188,7 +584,12 @@ class Keysight_34465A_T10(Keysight_34465A):
     """
     def __init__(self, name, address, **kwargs):
         super().__init__(name, address, **kwargs)
+        self._add_t10_parameters()
 
+    def _add_t10_parameters(self):
+        """
+        Add the I-V converted current parameter
+        """
         self.iv_conv = 1
 
         self.add_parameter('ivconv',
@@ -207,7 +608,12 @@ class ZIUHFLI_T10(ZIUHFLI):
 
     def __init__(self, name, address, **kwargs):
         super().__init__(name, address, **kwargs)
+        self._add_t10_parameters()
 
+    def _add_t10_parameters(self):
+        """
+        Add the averaged scope parameters
+        """
         self.add_parameter('scope_avg_ch1',
                            channel=1,
                            label='',
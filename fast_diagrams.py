@@ -1,6 +1,8 @@
 from qcodes.utils.wrappers import do1d
 import qcodes as qc
 
+from virtual_gates import qdac_channel_number
+
 def prepare_measurement(keysight_low_V, keysight_high_V, scope_avger, qdac_fast_channel, npts, zi, add_offset: bool=True):
     """
     Args:
@@ -34,7 +36,8 @@ def fast_charge_diagram(keysight_channel, fast_v_start, fast_v_stop, n_averages,
                         scope_signal, zi_trig_signal='Trig Input 1',
                         trigger_holdoff=60e-6, zi_samplingrate='14.0 MHz', zi_scope_length=4096,
                         zi_trig_hyst=0, zi_trig_level=.5, zi_trig_delay = 0, print_settings=False,
-                        keysight_voltage_multiplier=1, zi=None, keysight=None, tasks_to_perform=None):
+                        keysight_voltage_multiplier=1, zi=None, keysight=None, tasks_to_perform=None,
+                        virtual_gates=None, comp_channel=None):
     """
     Args:
         keysight_channel:
@@ -60,6 +63,17 @@ def fast_charge_diagram(keysight_channel, fast_v_start, fast_v_stop, n_averages,
         between the keysight and your device that divides the voltage by 5. You should
         set the fast_voltage_start and fast_voltage_stop to the values you want on the
         device and the values sent to the keysight will be 5*fast_voltage_start and 5*fast_voltage_stop
+        qdac_channel: The slow axis, e.g. a QDac channel voltage or a
+            VirtualGateParameter
+        comp_scale: Amplitude of the compensating ramp on Keysight channel 2
+            relative to channel 1 (ch01 only). Ignored if virtual_gates is
+            given.
+        virtual_gates: A VirtualGateMatrix containing the fast channel and
+            comp_channel. The fast axis is then its virtual gate, i.e.
+            comp_scale follows from the matrix. Needs keysight_channel
+            'ch01'.
+        comp_channel: The QDac channel number that Keysight channel 2 adds
+            to (with virtual_gates)
     """
 
     if zi is None:
@@ -69,6 +83,22 @@ def fast_charge_diagram(keysight_channel, fast_v_start, fast_v_stop, n_averages,
     if keysight_channel not in ['ch01', 'ch02']:
         raise ValueError('Invalid keysight channel. Must be either "ch01" or "ch02".')
 
+    if virtual_gates is not None:
+        # Only the fast ramp on channel 1 has a compensating ramp (on
+        # channel 2), so the compensation would be silently dropped
+        if keysight_channel != 'ch01':
+            raise ValueError('Virtual gate compensation needs the fast ramp '
+                             'on keysight channel "ch01", not '
+                             '"{}"'.format(keysight_channel))
+        # Channel 2 is coupled inverted, so it can only compensate in the
+        # opposite direction of the fast ramp
+        ratio = virtual_gates.compensation(
+            qdac_channel_number(qdac_fast_channel), comp_channel)
+        if ratio > 0:
+            raise ValueError('The inverted channel 2 can not compensate a '
+                             'positive cross-talk ratio of {}'.format(ratio))
+        comp_scale = -ratio
+
     if not isinstance(scope_signal, list):
         scope_signal = [scope_signal]
     
@@ -0,0 +1,304 @@
+# Module for hardware-timed sweeps of QDac channels, measured with the data
+# buffer of an SR830
+import logging
+import re
+import time
+
+import numpy as np
+import qcodes as qc
+from qcodes import ArrayParameter
+from qcodes.instrument.parameter import ManualParameter
+from qcodes.utils.wrappers import _do_measurement
+
+from customised_instruments import QDAC_MIN_RAMP_TIME
+from majorana_wrappers import ramp_qdac, wait_for_qdac_ramp
+from reload_settings import qdac_slopes
+
+log = logging.getLogger(__name__)
+
+# The internal sample rates of the SR830 buffer (Hz)
+SR830_SAMPLE_RATES = [62.5e-3, 0.125, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64,
+                      128, 256, 512]
+# The SR830 buffer holds at most this many points
+SR830_BUFFER_SIZE = 16383
+
+
+def sr830_sample_rate(delay):
+    """
+    The fastest SR830 sample rate with at least delay between points
+
+    Args:
+        delay (float): The minimal time per point (s)
+
+    Returns:
+        float: The sample rate (Hz)
+
+    Raises:
+        ValueError: If even the slowest rate is too fast
+    """
+    rates = [rate for rate in SR830_SAMPLE_RATES if rate*delay <= 1]
+    if not rates:
+        raise ValueError('The SR830 samples at least every {} s, not every '
+                         '{} s'.format(1/SR830_SAMPLE_RATES[0], delay))
+    return rates[-1]
+
+
+class QDacRampSweep(ArrayParameter):
+    """
+    A hardware-timed sweep of a QDac channel, measured with the data buffer
+    of an SR830.
+
+    Instead of setting the channel point by point, the QDac function
+    generator ramps the channel linearly from start to stop, while the
+    SR830 fills its buffer at its internal sample rate. The ramp takes
+    exactly (npts-1)/sample_rate, so sample k is taken at the k-th
+    setpoint. The host only sends the ramp and reads the buffer once.
+
+    The QDac can not be programmed with an arbitrary staircase, so the
+    voltage changes continuously rather than in steps. The lock-in time
+    constant should therefore be small compared to 1/sample_rate.
+
+    By default the buffer is started by the host right after the ramp,
+    which offsets the data by one command latency. If a QDac sync output
+    is wired to the trigger input of the SR830, pass its number as sync
+    and the ramp starts the buffer.
+
+    With snake, every get sweeps in the opposite direction of the previous
+    one, and the data are returned in the order of the setpoints.
+
+    The sample rate is set and the buffer readout prepared only for the
+    first sweep, later sweeps only reset and read the buffer.
+
+    Args:
+        name (str): The parameter name
+        qdac_channel (QDacChannel): The channel to sweep
+        buffer (ChannelBuffer): The buffer parameter to measure, e.g.
+            lockin.conductance or lockin.ch1_databuffer
+        start (float): Start of the sweep (V)
+        stop (float): End of the sweep (V)
+        npts (int): The number of points
+        sample_rate (float): One of SR830_SAMPLE_RATES (Hz)
+        sync (Optional[int]): The QDac sync output triggering the SR830
+        snake (bool): Alternate the sweep direction
+        max_slope (Optional[float]): The maximal slope of the channel
+            (V/s). Default: the slope in the config file, if any
+    """
+
+    def __init__(self, name, qdac_channel, buffer, start, stop, npts,
+                 sample_rate, sync=None, snake=False, max_slope=None,
+                 **kwargs):
+        if sample_rate not in SR830_SAMPLE_RATES:
+            raise ValueError('Invalid SR830 sample rate: '
+                             '{}'.format(sample_rate))
+        if not 1 < npts <= SR830_BUFFER_SIZE:
+            raise ValueError('The number of points must be between 2 and '
+                             '{}'.format(SR830_BUFFER_SIZE))
+
+        super().__init__(name, shape=(npts,),
+                         label=buffer.label, unit=buffer.unit,
+                         setpoint_names=(qdac_channel.v.name,),
+                         setpoint_labels=(qdac_channel.v.label,),
+                         setpoint_units=('V',),
+                         instrument=buffer._instrument, **kwargs)
+
+        self.qdac_channel = qdac_channel
+        self.buffer = buffer
+        self.start = start
+        self.stop = stop
+        self.npts = npts
+        self.sample_rate = sample_rate
+        self.sync = sync
+        self.snake = snake
+        self.reverse = False
+        self.setpoints = (tuple(np.linspace(start, stop, npts)),)
+        self._prepared = False
+
+        if self.ramp_time < QDAC_MIN_RAMP_TIME:
+            raise ValueError('The sweep is too fast for the QDac. Use fewer '
+                             'points or a lower sample rate.')
+
+        if max_slope is None:
+            channel_id = int(re.findall('\d+', qdac_channel.name)[0])
+            max_slope = qdac_slopes().get(channel_id)
+        if max_slope is not None and self.slope > max_slope:
+            raise ValueError('The sweep ramps {} at {:.3g} V/s, faster than '
+                             'its maximal slope of {} V/s. Use more points or '
+                             'a lower sample rate.'.format(qdac_channel.name,
+                                                           self.slope,
+                                                           max_slope))
+
+    @property
+    def ramp_time(self):
+        """
+        The duration of the sweep (s)
+        """
+        return (self.npts-1)/self.sample_rate
+
+    @property
+    def slope(self):
+        """
+        The QDac slope of the sweep (V/s)
+        """
+        return abs(self.stop-self.start)/self.ramp_time
+
+    def _arm(self):
+        lockin = self.buffer._instrument
+
+        lockin.buffer_pause()
+        lockin.buffer_reset()
+        if not self._prepared:
+            # Setting the sample rate invalidates the buffer readout
+            lockin.buffer_acq_mode('Single shot')
+            lockin.buffer_SR(self.sample_rate)
+
+        if self.sync is not None:
+            self.qdac_channel.sync(self.sync)
+            # The trigger from the sync output starts the buffer
+            lockin.buffer_trig_mode('ON')
+            lockin.buffer_start()
+
+    def _disarm(self):
+        if self.sync is not None:
+            self.qdac_channel.sync(0)
+            self.buffer._instrument.buffer_trig_mode('OFF')
+
+    def _prepare_readout(self):
+        # prepare_buffer_readout sets the unit of the buffer to the one of
+        # the display, e.g. V for the conductance
+        unit = self.buffer.unit
+        self.buffer.prepare_buffer_readout()
+        self.buffer.unit = unit
+        self._prepared = True
+
+    def get(self):
+        lockin = self.buffer._instrument
+        chan = self.qdac_channel
+
+        begin, end = self.start, self.stop
+        if self.reverse:
+            begin, end = end, begin
+
+        ramp_qdac(chan, begin)
+        self._arm()
+
+        try:
+            chan.slope(self.slope)
+            chan.v.set(end)
+            if self.sync is None:
+                lockin.buffer_start()
+
+            wait_for_qdac_ramp({chan: end}, self.ramp_time)
+            chan.slope('Inf')
+
+            # The buffer may lag the ramp by a sample
+            deadline = time.perf_counter() + 2/self.sample_rate + 1
+            while True:
+                npts = lockin.buffer_npts()
+                if npts >= self.npts or time.perf_counter() > deadline:
+                    break
+                time.sleep(min(1/self.sample_rate, 0.1))
+            lockin.buffer_pause()
+
+            if not self._prepared:
+                self._prepare_readout()
+            # The number of points of this sweep, from the last poll
+            self.buffer.shape = (npts,)
+            data = (np.asarray(self.buffer.get(), dtype=float)[:self.npts]
+                    if npts else np.array([]))
+        finally:
+            self._disarm()
+
+        if len(data) < self.npts:
+            log.warning('{} got {} of {} points'.format(self.full_name,
+                                                        len(data), self.npts))
+            data = np.append(data, np.full(self.npts-len(data), np.nan))
+
+        if self.reverse:
+            data = data[::-1]
+        if self.snake:
+            self.reverse = not self.reverse
+
+        return data
+
+
+def _hardware_sweep(inst_set, start, stop, n_points, delay, buffer,
+                    sync=None, snake=False):
+    """
+    Make the QDacRampSweep of a QDac channel voltage parameter
+    """
+    chan = inst_set._instrument
+    if not hasattr(chan, 'slope'):
+        raise ValueError('Hardware-timed sweeps need a QDac channel, not '
+                         '{}'.format(inst_set.full_name))
+
+    sample_rate = sr830_sample_rate(delay)
+    return QDacRampSweep('{}_sweep'.format(buffer.name), chan, buffer,
+                         start, stop, n_points, sample_rate, sync=sync,
+                         snake=snake)
+
+
+def do1d_hardware(inst_set, start, stop, n_points, delay, buffer,
+                  repetitions=1, sync=None):
+    """
+    Hardware-timed version of do1d: the QDac ramps inst_set while the SR830
+    buffer records. The sweep is repeated and the traces are stacked.
+
+    Args:
+        inst_set: The voltage parameter of a QDac channel
+        start: Start of sweep
+        stop: End of sweep
+        n_points: The number of points
+        delay: Time per point. The SR830 samples at the fastest rate not
+            exceeding 1/delay.
+        buffer: The SR830 buffer to measure, e.g. lockin.conductance
+        repetitions: The number of sweeps
+        sync: The QDac sync output triggering the SR830, if wired
+
+    Returns:
+        plot, data : returns the plot and the dataset
+    """
+    sweep = _hardware_sweep(inst_set, start, stop, n_points, delay, buffer,
+                            sync)
+
+    repetition = ManualParameter('repetition', initial_value=1)
+    loop = qc.Loop(repetition.sweep(1, repetitions, step=1)).each(sweep)
+
+    set_params = ((repetition, 1, repetitions),
+                  (inst_set, start, stop))
+    return _do_measurement(loop, set_params, (sweep,), do_plots=True)
+
+
+def do2d_hardware(inst_set, start, stop, n_points, delay, inst_set2, start2,
+                  stop2, n_points2, delay2, buffer, sync=None, snake=False):
+    """
+    Hardware-timed version of do2d: for each value of the outer parameter
+    inst_set, the QDac ramps inst_set2 while the SR830 buffer records.
+
+    Args:
+        inst_set: The outer parameter
+        start: Start of the outer sweep
+        stop: End of the outer sweep
+        n_points: The number of points of the outer sweep
+        delay: Delay at every step of the outer sweep
+        inst_set2: The voltage parameter of a QDac channel
+        start2: Start of the hardware-timed sweep
+        stop2: End of the hardware-timed sweep
+        n_points2: The number of points of the hardware-timed sweep
+        delay2: Time per point of the hardware-timed sweep. The SR830
+            samples at the fastest rate not exceeding 1/delay2.
+        buffer: The SR830 buffer to measure, e.g. lockin.conductance
+        sync: The QDac sync output triggering the SR830, if wired
+        snake: Alternate the direction of the hardware-timed sweep
+
+    Returns:
+        plot, data : returns the plot and the dataset
+    """
+    sweep = _hardware_sweep(inst_set2, start2, stop2, n_points2, delay2,
+                            buffer, sync, snake)
+
+    loop = qc.Loop(inst_set.sweep(start, stop, num=n_points),
+                   delay).each(sweep)
+
+    set_params = ((inst_set, start, stop),
+                  (inst_set2, start2, stop2))
+    return _do_measurement(loop, set_params, (sweep,), do_plots=True)
@@ -0,0 +1,106 @@
+# Module for deferring imports of driver modules
+import importlib
+import threading
+import types
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stand-in for a module that is imported on first attribute access.
+
+    Args:
+        name (str): The full name of the module, e.g.
+            'qcodes.instrument_drivers.tektronix.AWG5014'
+        on_load (Optional[Callable]): Called with the module right after it
+            has been imported, e.g. to configure matplotlib
+    """
+
+    def __init__(self, name, on_load=None):
+        super().__init__(name)
+        self._lazy_module = None
+        self._lazy_on_load = on_load
+        self._lazy_lock = threading.Lock()
+
+    def _lazy_load(self):
+        # Instruments may be constructed from several threads at once
+        with self._lazy_lock:
+            if self._lazy_module is None:
+                module = importlib.import_module(self.__name__)
+                if self._lazy_on_load is not None:
+                    self._lazy_on_load(module)
+                self._lazy_module = module
+        return self._lazy_module
+
+    @property
+    def is_loaded(self):
+        return self._lazy_module is not None
+
+    def __getattr__(self, attr):
+        # Only called for attributes not found on the stand-in itself
+        return getattr(self._lazy_load(), attr)
+
+    def __dir__(self):
+        return dir(self._lazy_load())
+
+    def __repr__(self):
+        state = 'loaded' if self.is_loaded else 'not loaded'
+        return '<lazy module {!r} ({})>'.format(self.__name__, state)
+
+
+class LazyAttribute:
+    """
+    Stand-in for a callable attribute of a module (e.g. an instrument
+    class), which imports the module when it is called.
+
+    Args:
+        module (str): The full name of the module
+        attr (str): The name of the attribute
+    """
+
+    def __init__(self, module, attr):
+        self._module = lazy_import(module)
+        self._attr = attr
+
+    def resolve(self):
+        """
+        Import the module and return the attribute
+        """
+        return getattr(self._module, self._attr)
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        return '<lazy {}.{}>'.format(self._module.__name__, self._attr)
+
+
+_lazy_modules = {}
+
+
+def lazy_import(name, on_load=None):
+    """
+    Return a LazyModule for the module with the given name. Repeated calls
+    return the same stand-in.
+
+    Example:
+        awg = lazy_import('qcodes.instrument_drivers.tektronix.AWG5014')
+        awg1 = awg.Tektronix_AWG5014('AWG1', address)  # imports here
+
+    Args:
+        name (str): The full name of the module
+        on_load (Optional[Callable]): Called with the module once imported
+    """
+    if name not in _lazy_modules:
+        _lazy_modules[name] = LazyModule(name, on_load)
+    return _lazy_modules[name]
+
+
+def lazy_from(module, attr):
+    """
+    Lazy version of 'from module import attr' for callables
+
+    Example:
+        MercuryiPS = lazy_from('qcodes.instrument_drivers.oxford.mercuryiPS',
+                               'MercuryiPS')
+    """
+    return LazyAttribute(module, attr)
@@ -4,32 +4,172 @@ from functools import partial
 from qcodes.instrument_drivers.devices import VoltageDivider
 from qcodes.instrument_drivers.QDev.QDac_channels import QDacChannel
 from qcodes.instrument.parameter import ManualParameter
+from qcodes.instrument.parameter import ArrayParameter
 from qcodes.instrument.parameter import StandardParameter
 from qcodes.utils.validators import Enum
 
 import re
 
+import asyncio
 import logging
 import os
+import threading
 import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
+import qcodes as qc
 from qcodes.utils.wrappers import _plot_setup, _save_individual_plots, do1d, do2d
-from reload_settings import used_channels
+from qcodes.utils.wrappers import _do_measurement
+from customised_instruments import QDAC_T10
+from reload_settings import used_channels, config_snapshot, qdac_slopes
+
+log = logging.getLogger(__name__)
+
+# The QDac has eight function generators, one per ramping channel
+QDAC_MAX_PARALLEL_RAMPS = 8
+
+# A ramp is done when the voltage readback is this close to the target (V)
+QDAC_RAMP_ATOL = 1e-4
+# Time between readbacks of the ramping channels (s)
+QDAC_RAMP_POLL_INTERVAL = 0.01
+# Start reading back this long before the predicted end of a ramp (s)
+QDAC_RAMP_POLL_LEAD = 0.05
+# Default timeout of a ramp on top of twice its predicted time (s)
+QDAC_RAMP_TIMEOUT_MARGIN = 1.0
+# The slowest slope the QDac slope validator accepts (V/s)
+QDAC_MIN_SLOPE = 1e-3
 
 ##################################################
 # Helper functions and wrappers
 
 
+class RampStatistics:
+    """
+    Statistics of the completion-detected qdac ramps, comparing the time
+    we waited with the predicted ramp time (distance/slope).
+
+    Attributes:
+        ramps (int): The number of ramps
+        timeouts (int): The number of ramps that timed out
+        predicted (float): The total predicted ramp time (s)
+        waited (float): The total time waited (s)
+        max_overwait (float): The largest waited - predicted (s)
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Reset all counters
+        """
+        self.ramps = 0
+        self.timeouts = 0
+        self.predicted = 0.0
+        self.waited = 0.0
+        self.max_overwait = 0.0
+
+    def record(self, predicted, waited, timed_out=False):
+        """
+        Add a ramp to the statistics
+        """
+        self.ramps += 1
+        self.timeouts += int(timed_out)
+        self.predicted += predicted
+        self.waited += waited
+        self.max_overwait = max(self.max_overwait, waited - predicted)
+
+    @property
+    def mean_overwait(self):
+        """
+        The mean of waited - predicted over all ramps (s)
+        """
+        if self.ramps == 0:
+            return 0.0
+        return (self.waited - self.predicted)/self.ramps
+
+    def __repr__(self):
+        return ('<RampStatistics: {} ramps, {} timeouts, mean overwait '
+                '{:.3f} s, max overwait {:.3f} s>'.format(
+                    self.ramps, self.timeouts, self.mean_overwait,
+                    self.max_overwait))
+
+
+RAMP_STATS = RampStatistics()
+
+
+def wait_for_qdac_ramp(targets, predicted, timeout=None):
+    """
+    Wait until qdac channels have reached their target voltages.
+
+    We sleep until QDAC_RAMP_POLL_LEAD before the predicted end of the
+    ramp and then read back all voltages, until every channel is within
+    QDAC_RAMP_ATOL of its target. Each poll is one status query per QDac
+    (QDAC_T10.get_voltages), whatever the number of ramping channels; a
+    v.get of a single channel costs the same status query. The wait is
+    recorded in RAMP_STATS.
+
+    Args:
+        targets (dict): The target voltage of each QDac Channel
+        predicted (float): The predicted ramp time (s)
+        timeout (Optional[float]): Give up after this time (s). Default:
+            twice the predicted time plus QDAC_RAMP_TIMEOUT_MARGIN.
+
+    Returns:
+        bool: Whether all channels reached their targets
+    """
+    if timeout is None:
+        timeout = 2*predicted + QDAC_RAMP_TIMEOUT_MARGIN
+
+    start = time.perf_counter()
+    ramping = dict(targets)
+
+    sleep(max(predicted - QDAC_RAMP_POLL_LEAD, 0))
+    while True:
+        for qdac in {chan._parent for chan in ramping}:
+            voltages = qdac.get_voltages()
+            for chan in [chan for chan in ramping if chan._parent is qdac]:
+                if (abs(voltages[_channel_number(chan)] - ramping[chan]) <=
+                        QDAC_RAMP_ATOL):
+                    del ramping[chan]
+        done = not ramping
+        if done or time.perf_counter() - start > timeout:
+            break
+        sleep(QDAC_RAMP_POLL_INTERVAL)
+
+    waited = time.perf_counter() - start
+    RAMP_STATS.record(predicted, waited, timed_out=not done)
+    if not done:
+        log.warning('QDac ramp timed out after {:.2f} s: {}'.format(
+            waited, ', '.join('{} at {} V instead of {} V'.format(
+                chan.name, chan.v.get_latest(), target)
+                for chan, target in ramping.items())))
+
+    return done
+
+
+def _channel_number(chan):
+    """
+    The number of a qdac channel, e.g. 5 for chan5
+    """
+    return int(re.findall('\d+', chan.name)[0])
+
+
 def print_voltages():
     """
     Print qDac voltages
     """
 
+    qdac = qc.Station.default['qdac']
+    voltages = qdac.get_voltages()
+
     max_col_width = 38
     for channel in used_channels():
         col_width = max_col_width - len(qdac.channels[channel-1].v.label)
         mssg = ('Ch {: >2} - {} '.format(channel, qdac.channels[channel-1].v.label) +
-                ': {:>{col_width}}'.format(qdac.channels[channel-1].v.get(),
+                ': {:>{col_width}}'.format(voltages[channel],
                                            col_width=col_width))
         print(mssg)
 
@@ -99,45 +239,161 @@ def prepare_qdac(qdac_channel, start, stop, n_points, delay, ramp_slope=None):
     """
 
     if ramp_slope is None:
-        QDAC_SLOPES = qdac_slopes()
         channel_id = int(re.findall('\d+', qdac_channel.name)[0])
-        ramp_slope = QDAC_SLOPES[channel_id]
+        ramp_slope = config_snapshot().slope(channel_id)
 
     qdac_channel.slope(ramp_slope)
 
     try:
-        init_ramp_time = abs(start-qdac_channel.get())/ramp_slope
+        init_ramp_time = abs(start-qdac_channel.v.get())/ramp_slope
     except TypeError:
         init_ramp_time = 0
 
     qdac_channel.v.set(start)
-    time.sleep(init_ramp_time)
+    wait_for_qdac_ramp({qdac_channel: start}, init_ramp_time)
 
     try:
-        additional_delay_perPoint = (abs(stop-start)/n_points)/ramp_slope
-    except TypeError:
+        additional_delay_perPoint = (abs(stop-start)/(n_points-1))/ramp_slope
+    except (TypeError, ZeroDivisionError):
         additional_delay_perPoint = 0
 
     return additional_delay_perPoint, ramp_slope
 
 
-def do1d_M(inst_set, start, stop, n_points, delay, *inst_meas, ramp_slope=None):
+class _SnakeScan:
+    """
+    One row of a serpentine 2D scan. Every measure sweeps the inner
+    parameter in the opposite direction of the previous one, and stores the
+    measured values in the order of the setpoints.
+
+    Args:
+        inst_set: The inner parameter
+        start: Start of the inner sweep
+        stop: End of the inner sweep
+        n_points: The number of points of the inner sweep
+        delay: Delay at every step of the inner sweep
+        inst_meas: The parameters to measure at every point
+    """
+
+    def __init__(self, inst_set, start, stop, n_points, delay, inst_meas):
+        self.inst_set = inst_set
+        self.values = tuple(np.linspace(start, stop, n_points))
+        self.delay = delay
+        self.inst_meas = inst_meas
+        self.reverse = False
+        self.data = None
+
+    def measure(self):
+        n_points = len(self.values)
+        indices = range(n_points-1, -1, -1) if self.reverse else range(n_points)
+
+        self.data = np.full((len(self.inst_meas), n_points), np.nan)
+        for i in indices:
+            self.inst_set.set(self.values[i])
+            sleep(self.delay)
+            for j, param in enumerate(self.inst_meas):
+                self.data[j, i] = param.get()
+
+        self.reverse = not self.reverse
+
+
+class _SnakeRow(ArrayParameter):
+    """
+    The row of one measured parameter in a _SnakeScan. It has the name and
+    instrument of the measured parameter, so the arrays are named as in
+    do2d. The row of the first parameter runs the scan, the others return
+    its data.
+
+    Args:
+        scan (_SnakeScan): The scan
+        index (int): The index of the measured parameter in the scan
+    """
+
+    def __init__(self, scan, index):
+        param = scan.inst_meas[index]
+        super().__init__(param.name, shape=(len(scan.values),),
+                         instrument=param._instrument,
+                         label=param.label, unit=param.unit,
+                         setpoints=(scan.values,),
+                         setpoint_names=(scan.inst_set.full_name,),
+                         setpoint_labels=(scan.inst_set.label,),
+                         setpoint_units=(scan.inst_set.unit,))
+        self._scan = scan
+        self._index = index
+
+    def get(self):
+        if self._index == 0:
+            self._scan.measure()
+        return self._scan.data[self._index]
+
+
+def _prepare_virtual_gates(*sweeps):
+    """
+    Check the scan of the virtual gates among the sweep parameters against
+    the QDac channel ranges, and move them to their start values
+
+    Args:
+        *sweeps (Tuple[Parameter, float, float, int]): (parameter, start,
+            stop, n_points) of each sweep, outermost first
+    """
+    from virtual_gates import VirtualGateParameter
+
+    virtual = [(param, np.linspace(start, stop, n_points))
+               for param, start, stop, n_points in sweeps
+               if isinstance(param, VirtualGateParameter)]
+    if not virtual:
+        return
+
+    first, values = virtual[0]
+    if all(param.gates is first.gates for param, _ in virtual):
+        first.validate_sweep(values, *virtual[1:])
+    else:
+        for param, values in virtual:
+            param.validate_sweep(values)
+
+    for param, values in virtual:
+        param.ramp_to(values[0])
+
+
+def _hardware_buffer(inst_meas):
+    """
+    The single SR830 buffer measured in a hardware-timed sweep
+    """
+    if len(inst_meas) != 1:
+        raise ValueError('Hardware-timed sweeps measure exactly one SR830 '
+                         'buffer, e.g. lockin.conductance')
+    return inst_meas[0]
+
+
+def do1d_M(inst_set, start, stop, n_points, delay, *inst_meas, ramp_slope=None,
+           hardware_timed=False, sync=None):
     """
     Args:
-        inst_set:  Parameter to sweep over
+        inst_set:  Parameter to sweep over, e.g. a QDac channel voltage
+            or a VirtualGateParameter
         start:  Start of sweep
         stop:  End of sweep
         division:  Spacing between values
         delay:  Delay at every step
         *inst_meas:  any number of instrument to measure
         ramp_slope: 
+        hardware_timed: Let the QDac ramp inst_set while an SR830 buffer
+            records, see hardware_sweeps.do1d_hardware. inst_meas must then
+            be a single SR830 buffer.
+        sync: The QDac sync output triggering the SR830 (hardware_timed)
 
     Returns:
         plot, data : returns the plot and the dataset
 
     """
+    if hardware_timed:
+        from hardware_sweeps import do1d_hardware
+        return do1d_hardware(inst_set, start, stop, n_points, delay,
+                             _hardware_buffer(inst_meas), sync=sync)
+
     if isinstance(inst_set._instrument, QDacChannel):
         ramp_qdac(inst_set._instrument, start, ramp_slope)
+    _prepare_virtual_gates((inst_set, start, stop, n_points))
 
     plot, data = do1d(inst_set, start, stop, n_points, delay, *inst_meas)
 
@@ -145,7 +401,8 @@ def do1d_M(inst_set, start, stop, n_points, delay, *inst_meas, ramp_slope=None):
 
 
 def do2d_M(inst_set, start, stop, n_points, delay, inst_set2, start2, stop2,
-           n_points2, delay2, *inst_meas, ramp_slope1=None, ramp_slope2=None):
+           n_points2, delay2, *inst_meas, ramp_slope1=None, ramp_slope2=None,
+           hardware_timed=False, sync=None, snake=False):
     """
     Args:
         inst_set:  Instrument to sweep over
@@ -160,24 +417,75 @@ def do2d_M(inst_set, start, stop, n_points, delay, inst_set2, start2, stop2,
         delay_2:  Delay at every step for second intrument
         *inst_meas:
         ramp_slope:
+        hardware_timed: Let the QDac ramp inst_set2 while an SR830 buffer
+            records, see hardware_sweeps.do2d_hardware. inst_meas must then
+            be a single SR830 buffer.
+        sync: The QDac sync output triggering the SR830 (hardware_timed)
+        snake: Sweep inst_set2 back and forth instead of always from start2
+            to stop2, which saves ramping back for every row. The data are
+            stored in the order of the setpoints either way.
 
     Returns:
         plot, data : returns the plot and the dataset
     """
+    if hardware_timed:
+        from hardware_sweeps import do2d_hardware
+        if isinstance(inst_set._instrument, QDacChannel):
+            ramp_qdac(inst_set._instrument, start, ramp_slope1)
+        return do2d_hardware(inst_set, start, stop, n_points, delay,
+                             inst_set2, start2, stop2, n_points2, delay2,
+                             _hardware_buffer(inst_meas), sync=sync,
+                             snake=snake)
+
+    # Ramp both qdac channels to the start point at the same time
+    targets = {}
+    slopes = {}
     if isinstance(inst_set2._instrument, QDacChannel):
-        ramp_qdac(inst_set2._instrument, start, ramp_slope2)
-
+        targets[inst_set2._instrument] = start2
+        slopes[inst_set2._instrument] = ramp_slope2
     if isinstance(inst_set._instrument, QDacChannel):
-        ramp_qdac(inst_set._instrument, start, ramp_slope1)
+        targets[inst_set._instrument] = start
+        slopes[inst_set._instrument] = ramp_slope1
+    ramp_qdac_channels(targets, slopes)
+    _prepare_virtual_gates((inst_set, start, stop, n_points),
+                           (inst_set2, start2, stop2, n_points2))
 
     for inst in inst_meas:
         if getattr(inst, "setpoints", False):
             raise ValueError("3d plotting is not supported")
 
+    if snake:
+        if any(getattr(inst, 'names', False) for inst in inst_meas):
+            raise ValueError('Snake scans measure parameters with a single '
+                             'value, not {}'.format(inst_meas))
+        scan = _SnakeScan(inst_set2, start2, stop2, n_points2, delay2,
+                          inst_meas)
+        rows = tuple(_SnakeRow(scan, i) for i in range(len(inst_meas)))
+        loop = qc.Loop(inst_set.sweep(start, stop, num=n_points),
+                       delay).each(*rows)
+        set_params = ((inst_set, start, stop),
+                      (inst_set2, start2, stop2))
+        return _do_measurement(loop, set_params, rows, do_plots=True)
+
     plot, data = do2d(inst_set, start, stop, n_points, delay, inst_set2, start2, stop2, n_points2, delay2, *inst_meas)
 
     return plot, data
 
+def _ramp_slope(chan, slope=None):
+    """
+    The slope (V/s) to ramp a qdac channel with: the given slope or else
+    the one in the config file
+    """
+    if slope is None:
+        try:
+            channel_id = int(re.findall('\d+', chan.name)[0])
+            slope = config_snapshot().slope(channel_id)
+        except KeyError:
+            raise ValueError('No slope found in QDAC_SLOPES for {}. '
+                             'Please provide a slope!'.format(chan.name))
+    return slope
+
+
 def ramp_qdac(chan, target_voltage, slope=None):
     """
     Ramp a qdac channel. Blocking.
@@ -187,33 +495,357 @@ def ramp_qdac(chan, target_voltage, slope=None):
         target_voltage (float): Voltage to ramp to
         slope (float): The slope in (V/s)
     """
-    if slope is None:
-        try:
-            QDAC_SLOPES = qdac_slopes()
-            channel_id = int(re.findall('\d+', chan.name)[0])
-            slope = QDAC_SLOPES[channel_id]
-        except KeyError:
-            raise ValueError('No slope found in QDAC_SLOPES. '
-                             'Please provide a slope!')
+    ramp_qdac_channels({chan: target_voltage}, slope)
+
+
+def ramp_qdac_channels(targets, slope=None, start=None):
+    """
+    Ramp several qdac channels simultaneously. Blocking.
 
-    # Make the ramp blocking, so that we may unassign the slope
-    ramp_time = abs(chan.v.get() -
-                    target_voltage)/slope + 0.03
+    The voltages are read once (or taken from start), all slopes and
+    targets are validated, and the ramps are started back to back (see
+    QDAC_T10.ramp_voltages), so all channels start together. Then we wait
+    once until every channel has reached its target (see
+    wait_for_qdac_ramp) and unassign the slopes. The slopes are unassigned
+    even if a command fails, so no channel is left with a function
+    generator. The QDac can only ramp QDAC_MAX_PARALLEL_RAMPS channels at a
+    time, so more channels are ramped in batches.
 
-    chan.slope.set(slope)
-    chan.v.set(target_voltage)
-    sleep(ramp_time)
-    chan.slope.set('Inf')
+    Args:
+        targets (dict): The voltage to ramp to for each QDac Channel
+        slope (Union[float, dict, None]): The slope in (V/s), either for all
+            channels or for each channel. Channels without a slope use the
+            one in the config file.
+        start (Optional[dict]): The present voltage of each QDac Channel.
+            Default: read from the QDac
+    """
+    chans = list(targets)
+
+    for first in range(0, len(chans), QDAC_MAX_PARALLEL_RAMPS):
+        batch = chans[first:first+QDAC_MAX_PARALLEL_RAMPS]
+
+        slopes = {}
+        for chan in batch:
+            if isinstance(slope, dict):
+                slopes[chan] = _ramp_slope(chan, slope.get(chan))
+            else:
+                slopes[chan] = _ramp_slope(chan, slope)
+            # Fail before anything moves
+            chan.v.validate(targets[chan])
+            chan.slope.validate(slopes[chan])
+
+        qdacs = {}
+        for chan in batch:
+            qdacs.setdefault(chan._parent, []).append(chan)
+
+        ramp_time = 0
+        assigned = []
+        try:
+            for qdac, group in qdacs.items():
+                assigned.extend(group)
+                numbers = {chan: _channel_number(chan) for chan in group}
+                ramp_time = max(ramp_time, qdac.ramp_voltages(
+                    {numbers[chan]: targets[chan] for chan in group},
+                    {numbers[chan]: slopes[chan] for chan in group},
+                    None if start is None else
+                    {numbers[chan]: start[chan] for chan in group}))
+
+            # Make the ramp blocking, so that we may unassign the slopes
+            wait_for_qdac_ramp({chan: targets[chan] for chan in batch},
+                               ramp_time)
+        finally:
+            _unassign_slopes(assigned)
+
+
+def _unassign_slopes(chans):
+    """
+    Unassign the slopes, and thereby the function generators, of qdac
+    channels. Tries every channel even if one fails.
+    """
+    for chan in chans:
+        try:
+            chan.slope.set('Inf')
+        except Exception:
+            log.exception('Could not unassign the slope of '
+                          '{}'.format(chan.name))
 
 
 def ramp_several_qdac_channels(loc, target_voltage, slope=None):
     """
-    Ramp several QDac channels to the same value
+    Ramp several QDac channels to the same value, simultaneously
 
     Args:
         loc (list): List of channels to ramp
         target_voltage (float): Voltage to ramp to
         slope (float): The slope in (V/s)
     """
-    for ch in loc:
-        ramp_qdac(ch, target_voltage, slope)
\ No newline at end of file
+    ramp_qdac_channels({ch: target_voltage for ch in loc}, slope)
+
+
+
+GateTrajectory = namedtuple('GateTrajectory',
+                            ['start', 'stop', 'slopes', 'duration'])
+GateTrajectory.__doc__ = """
+A straight-line move of several gates, see plan_gate_trajectory.
+
+Attributes:
+    start (dict): The start voltage of each channel number
+    stop (dict): The target voltage of each channel number
+    slopes (dict): The slope (V/s) of each channel that moves
+    duration (float): The duration of the move (s)
+"""
+
+
+def plan_gate_trajectory(start, stop, max_slopes):
+    """
+    Plan moving several gates along the straight line between two gate
+    vectors.
+
+    All channels start and arrive together, so the duration is set by the
+    channel that needs the longest at its maximal slope, and every other
+    channel ramps proportionally slower. The QDac can not ramp slower than
+    QDAC_MIN_SLOPE, so a channel moving very little compared to the others
+    ramps at QDAC_MIN_SLOPE and arrives early.
+
+    Args:
+        start (dict): The start voltage of each channel number
+        stop (dict): The target voltage of each channel number
+        max_slopes (dict): The maximal slope (V/s) of each channel number,
+            e.g. qdac_slopes()
+
+    Returns:
+        GateTrajectory: The plan
+
+    Raises:
+        ValueError: If a channel has no maximal slope, or one below
+            QDAC_MIN_SLOPE
+    """
+    chans = [ch for ch in stop if stop[ch] != start[ch]]
+    missing = [ch for ch in chans if ch not in max_slopes]
+    if missing:
+        raise ValueError('No slope for channel(s) {}. Please provide '
+                         'one!'.format(missing))
+
+    deltas = np.array([abs(stop[ch] - start[ch]) for ch in chans])
+    limits = np.array([max_slopes[ch] for ch in chans], dtype=float)
+
+    too_slow = [ch for ch, limit in zip(chans, limits)
+                if limit < QDAC_MIN_SLOPE]
+    if too_slow:
+        raise ValueError('The maximal slope of channel(s) {} is below the '
+                         'QDac minimum of {} V/s'.format(too_slow,
+                                                         QDAC_MIN_SLOPE))
+
+    duration = float((deltas/limits).max()) if chans else 0.0
+    slopes = {ch: max(float(delta)/duration, QDAC_MIN_SLOPE)
+              for ch, delta in zip(chans, deltas)}
+
+    return GateTrajectory(dict(start), dict(stop), slopes, duration)
+
+
+def move_gates(targets, max_slopes=None, qdac=None):
+    """
+    Move several gates together along the straight line to the targets.
+    Blocking. Prints the duration and the estimated time of arrival.
+
+    Args:
+        targets (dict): The target voltage of each channel number
+        max_slopes (Optional[dict]): The maximal slope (V/s) of each
+            channel number. Default: the slopes of the config file
+        qdac (Optional[QDAC_T10]): Default: the station qdac
+
+    Returns:
+        GateTrajectory: The executed plan
+    """
+    if qdac is None:
+        qdac = qc.Station.default['qdac']
+    if max_slopes is None:
+        max_slopes = qdac_slopes()
+
+    voltages = qdac.get_voltages()
+    start = {ch: float(voltages[ch]) for ch in targets}
+    plan = plan_gate_trajectory(start, targets, max_slopes)
+
+    if len(plan.slopes) > QDAC_MAX_PARALLEL_RAMPS:
+        raise ValueError('The QDac can only ramp {} channels at a time, '
+                         'not {}'.format(QDAC_MAX_PARALLEL_RAMPS,
+                                         len(plan.slopes)))
+    if not plan.slopes:
+        return plan
+
+    eta = time.strftime('%H:%M:%S',
+                        time.localtime(time.time() + plan.duration))
+    print('Moving {} gates in {:.1f} s, ETA {}'.format(len(plan.slopes),
+                                                      plan.duration, eta))
+
+    chans = {ch: qdac.channels[ch-1] for ch in plan.slopes}
+    ramp_qdac_channels({chans[ch]: targets[ch] for ch in plan.slopes},
+                       {chans[ch]: slope for ch, slope in plan.slopes.items()},
+                       start={chans[ch]: start[ch] for ch in plan.slopes})
+
+    return plan
+
+##################################################
+# Awaitable versions of the blocking functions
+#
+# The blocking functions run in the default executor, so e.g. a gate ramp
+# can overlap with configuring the scope and the function generator:
+#
+#     run_async(ramp_qdac_async(qdac.ch01, 0.5),
+#               set_parameters_async({zi.scope_length: 4096,
+#                                     keysight.ch1_frequency: 1e3}))
+#
+# Commands to one instrument are serialised by a lock per instrument. The
+# QDac uses its io_lock, which all its communication holds.
+#
+# In a Jupyter/IPython kernel an event loop is already running, so there
+# the coroutines can also be awaited directly:
+#
+#     await asyncio.gather(ramp_qdac_async(qdac.ch01, 0.5), ...)
+
+
+_instrument_locks = {}
+_instrument_locks_lock = threading.Lock()
+# Shared by all parameters without instrument
+_no_instrument_lock = threading.Lock()
+
+
+def _instrument_lock(instrument):
+    """
+    The lock of an instrument. Channels share the lock of their parent.
+    Instruments with an io_lock (QDAC_T10) use it. Without instrument
+    (None), a lock shared by all such callers.
+    """
+    if instrument is None:
+        return _no_instrument_lock
+
+    while getattr(instrument, '_parent', None) is not None:
+        instrument = instrument._parent
+
+    if isinstance(instrument, QDAC_T10):
+        return instrument.io_lock
+
+    with _instrument_locks_lock:
+        return _instrument_locks.setdefault(instrument.name, threading.Lock())
+
+
+async def run_blocking_async(func, *args, instrument=None, **kwargs):
+    """
+    Run a blocking function in the default executor.
+
+    Args:
+        func (Callable): The function to run
+        *args: Positional arguments of func
+        instrument (Optional[Instrument]): Hold the lock of this instrument
+            while func runs
+        **kwargs: Keyword arguments of func
+
+    Returns:
+        The return value of func
+    """
+    def call():
+        if instrument is None:
+            return func(*args, **kwargs)
+        with _instrument_lock(instrument):
+            return func(*args, **kwargs)
+
+    # Inside a coroutine this is the running loop
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, call)
+
+
+async def ramp_qdac_async(chan, target_voltage, slope=None):
+    """
+    Awaitable version of ramp_qdac
+    """
+    return await run_blocking_async(ramp_qdac, chan, target_voltage, slope,
+                                    instrument=chan)
+
+
+async def ramp_qdac_channels_async(targets, slope=None):
+    """
+    Awaitable version of ramp_qdac_channels. The channels should belong to
+    the same QDac.
+    """
+    chans = list(targets)
+    instrument = chans[0] if chans else None
+    return await run_blocking_async(ramp_qdac_channels, targets, slope,
+                                    instrument=instrument)
+
+
+async def prepare_qdac_async(qdac_channel, start, stop, n_points, delay,
+                             ramp_slope=None):
+    """
+    Awaitable version of prepare_qdac
+    """
+    return await run_blocking_async(prepare_qdac, qdac_channel, start, stop,
+                                    n_points, delay, ramp_slope,
+                                    instrument=qdac_channel)
+
+
+async def set_parameters_async(values):
+    """
+    Set parameters, one instrument after the other but the instruments
+    concurrently.
+
+    Args:
+        values (dict): The value of each parameter. The parameters of one
+            instrument are set in the given order. Parameters without
+            instrument are set one after the other.
+    """
+    per_instrument = {}
+    for param, value in values.items():
+        instrument = getattr(param, '_instrument', None)
+        per_instrument.setdefault(instrument, []).append((param, value))
+
+    def set_all(instrument, pairs):
+        with _instrument_lock(instrument):
+            for param, value in pairs:
+                param.set(value)
+
+    await asyncio.gather(*[run_blocking_async(set_all, instrument, pairs)
+                           for instrument, pairs in per_instrument.items()])
+
+
+async def _gather(*coroutines):
+    return list(await asyncio.gather(*coroutines))
+
+
+def _run_in_new_loop(coroutine):
+    """
+    Run a coroutine in a new event loop, e.g. on a worker thread without
+    event loop
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def run_async(*coroutines):
+    """
+    Run coroutines concurrently and wait for all of them. Blocking.
+
+    Outside of an event loop, e.g. in a script, they run in the event loop
+    of the thread. Inside a running event loop, e.g. in a Jupyter kernel,
+    they run in a new event loop on a worker thread, as the running loop
+    can not be blocked on. There, awaiting the coroutines directly is
+    preferable.
+
+    Returns:
+        list: The return values of the coroutines
+    """
+    # asyncio.run and get_running_loop need Python 3.7
+    try:
+        loop = asyncio.get_event_loop()
+    except RuntimeError:
+        # No event loop in this (non-main) thread
+        return _run_in_new_loop(_gather(*coroutines))
+
+    if not loop.is_running():
+        return loop.run_until_complete(_gather(*coroutines))
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(_run_in_new_loop,
+                               _gather(*coroutines)).result()
@@ -1,38 +1,41 @@
 import logging
+import threading
+from collections import namedtuple
+
+import numpy as np
 import qcodes as qc
+from qcodes.loops import active_loop
 from qcodes.utils.validators import Numbers
 
-from qcodes.utils.configreader import Config
+from configreader import Config, QDAC_N_CHANNELS
+from customised_instruments import QDAC_MAX_VOLTAGE
 
 log = logging.getLogger(__name__)
 
 
-def bias_channels():
+def config_snapshot():
     """
-    A convenience function returning a list of bias channels.
+    Return the typed snapshot of the default config object, re-parsing
+    the config file only if it has changed on disk.
     """
-
     configs = Config.default
     configs.reload()
 
-    bias_chan1 = configs.get('Channel Parameters', 'topo bias channel')
-    # bias_chan2 = configs.get('Channel Parameters', 'left sensor bias channel')
-    # bias_chan3 = configs.get('Channel Parameters', 'right sensor bias channel')
+    return configs.snapshot
+
 
-    #return [int(bias_chan1), int(bias_chan2), int(bias_chan3)]
-    return [int(bias_chan1)]
+def bias_channels():
+    """
+    A convenience function returning a list of bias channels.
+    """
+    return list(config_snapshot().bias_channels)
 
 
 def used_channels():
     """
     Return a list of currently labelled channels as ints.
     """
-
-    configs = Config.default
-    configs.reload()
-
-    l_chs = configs.get('QDac Channel Labels')
-    return sorted([int(key) for key in l_chs.keys()])
+    return list(config_snapshot().used_channels)
 
 
 def used_voltage_params():
@@ -54,13 +57,7 @@ def channel_labels():
     Returns a dict of the labelled channels. Key: channel number (int),
     value: label (str)
     """
-    configs = Config.default
-    configs.reload()
-
-    labs = configs.get('QDac Channel Labels')
-    output = dict(zip([int(key) for key in labs.keys()], labs.values()))
-
-    return output
+    return config_snapshot().channel_labels()
 
 
 def print_voltages_all():
@@ -71,52 +68,152 @@ def print_voltages_all():
     station = qc.Station.default
     qdac = station['qdac']
 
-    for channel in qdac.channels:
-        print('{}: {} V'.format(channel.name, channel.v.get()))
+    voltages = qdac.get_voltages()
+    for chan_id, channel in enumerate(qdac.channels, start=1):
+        print('{}: {} V'.format(channel.name, voltages[chan_id]))
 
-    check_unused_qdac_channels()
+    check_unused_qdac_channels(voltages)
 
 
 def qdac_slopes():
     """
     Returns a dict with the QDac slopes defined in the config file
     """
+    snapshot = config_snapshot()
 
-    configs = Config.default
-    configs.reload()
+    chans = sorted(set(snapshot.used_channels + snapshot.bias_channels))
+    QDAC_SLOPES = {ch: float(snapshot.slopes[ch]) for ch in chans}
 
-    qdac_slope = float(configs.get('Ramp speeds',
-                                   'max rampspeed qdac'))
-    bg_slope = float(configs.get('Ramp speeds',
-                                 'max rampspeed bg'))
-    bias_slope = float(configs.get('Ramp speeds',
-                                   'max rampspeed bias'))
+    return QDAC_SLOPES
 
-    QDAC_SLOPES = dict(zip(used_channels(),
-                           len(used_channels())*[qdac_slope]))
 
-#    QDAC_SLOPES[int(configs.get('Channel Parameters',
-#                                'backgate channel'))] = bias_slope
-    for ii in bias_channels():
-        QDAC_SLOPES[ii] = bias_slope
+QDacAudit = namedtuple('QDacAudit', ['voltages', 'used', 'offending'])
+QDacAudit.__doc__ = """
+Result of audit_unused_qdac_channels.
 
-    return QDAC_SLOPES
+Attributes:
+    voltages (numpy.ndarray): The voltage of each channel, indexed by
+        channel number (entry 0 is unused)
+    used (numpy.ndarray): Boolean mask of the labelled channels
+    offending (tuple): The unused channels with a non-zero voltage
+"""
+
+
+def audit_unused_qdac_channels(qdac=None, atol=0.0, voltages=None):
+    """
+    Compare the voltages of all QDac channels against the labelled
+    channels of the config file. Performs a single status query.
+
+    Args:
+        qdac (Optional[QDac]): The QDac to audit. Default: the station qdac
+        atol (float): Voltages with an absolute value below this are
+            considered zero
+        voltages (Optional[numpy.ndarray]): Voltages from
+            QDAC_T10.get_voltages, to audit without querying the QDac again
+
+    Returns:
+        QDacAudit: The voltages, the used-channel mask and the offending
+            channels
+    """
+    snapshot = config_snapshot()
+    if voltages is None:
+        if qdac is None:
+            qdac = qc.Station.default['qdac']
+        voltages = qdac.get_voltages()
+
+    unused = ~snapshot.used
+    unused[0] = False
+    # NaN (unknown voltage) compares False and is never reported
+    nonzero = np.abs(voltages) > atol
+    offending = tuple(int(ch) for ch in np.flatnonzero(unused & nonzero))
+
+    return QDacAudit(voltages, snapshot.used, offending)
 
 
-def check_unused_qdac_channels():
+def check_unused_qdac_channels(voltages=None):
     """
     Check whether any UNASSIGNED QDac channel has a non-zero voltage
+
+    Args:
+        voltages (Optional[numpy.ndarray]): Voltages from
+            QDAC_T10.get_voltages. Default: query the station qdac
     """
-    station = qc.Station.default
+    report = audit_unused_qdac_channels(voltages=voltages)
 
-    qdac = station['qdac']
+    for ch in report.offending:
+        log.warning('Unused qDac channel not zero: channel '
+                    '{:02}: {}'.format(ch, report.voltages[ch]))
+
+    return report
+
+
+class QDacAuditThread(threading.Thread):
+    """
+    Background thread running check_unused_qdac_channels at a low rate.
 
-    qdac._get_status()
-    for ch in [el for el in range(1, 48) if el not in used_channels()]:
-        temp_v = qdac.channels[ch-1].v.get_latest()
-        if temp_v != 0.0:
-            log.warning('Unused qDac channel not zero: channel '
-                        '{:02}: {}'.format(ch, temp_v))
+    The status query shares the serial link with any measurement using the
+    QDac, so an audit is skipped while a Loop is running or while another
+    thread holds the io_lock of the QDac, e.g. during a ramp or a command.
+    The lock is held during the audit, so other threads wait for it.
+
+    Args:
+        interval (float): The time between audits (s)
+    """
+
+    def __init__(self, interval=300):
+        super().__init__(name='QDacAuditThread', daemon=True)
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self._audit()
+            except Exception:
+                log.exception('QDac audit failed')
+
+    def _audit(self):
+        # Imported here, since majorana_wrappers imports this module
+        from majorana_wrappers import _instrument_lock
+
+        if active_loop() is not None:
+            log.debug('Skipping the QDac audit during a measurement')
+            return
+
+        lock = _instrument_lock(qc.Station.default['qdac'])
+        if not lock.acquire(blocking=False):
+            log.debug('Skipping the QDac audit, the QDac is busy')
+            return
+        try:
+            # A Loop may have started while we waited for the lock
+            if active_loop() is None:
+                check_unused_qdac_channels()
+        finally:
+            lock.release()
+
+    def stop(self):
+        """
+        Stop the thread. Returns once the current audit is done.
+        """
+        self._stop_event.set()
+        self.join()
+
+
+def start_qdac_audit(interval=300):
+    """
+    Start a background audit of the unused QDac channels.
+
+    Args:
+        interval (float): The time between audits (s)
+
+    Returns:
+        QDacAuditThread: The running thread. Audits are skipped during
+            measurements.
+    """
+    thread = QDacAuditThread(interval)
+    thread.start()
+
+    return thread
 
 
 def reload_DMM_settings():
@@ -126,12 +223,11 @@ def reload_DMM_settings():
 
     # Get the two global objects containing the instruments and settings
     station = qc.Station.default
-    configs = Config.default
-    configs.reload()
+    gains = config_snapshot().gains
 
     dmm_top = station['keysight_dmm_top']
 
-    dmm_top.iv_conv = float(configs.get('Gain settings', 'iv topo gain'))
+    dmm_top.iv_conv = gains['iv topo gain']
 
 
 def reload_SR830_settings():
@@ -141,8 +237,7 @@ def reload_SR830_settings():
 
     # Get the two global objects containing the instruments and settings
     station = qc.Station.default
-    configs = Config.default
-    configs.reload()
+    gains = config_snapshot().gains
 
     # one could put in some validation here if wanted
 
@@ -150,19 +245,13 @@ def reload_SR830_settings():
     lockin_right = station['lockin_r']
     lockin_left = station['lockin_l']
 
-    lockin_topo.acfactor = float(configs.get('Gain settings',
-                                             'ac factor topo'))
-    lockin_right.acfactor = float(configs.get('Gain settings',
-                                              'ac factor right'))
-    lockin_left.acfactor = float(configs.get('Gain settings',
-                                             'ac factor left'))
+    lockin_topo.acfactor = gains['ac factor topo']
+    lockin_right.acfactor = gains['ac factor right']
+    lockin_left.acfactor = gains['ac factor left']
 
-    lockin_topo.ivgain = float(configs.get('Gain settings',
-                                           'iv topo gain'))
-    lockin_right.ivgain = float(configs.get('Gain settings',
-                                            'iv right gain'))
-    lockin_left.ivgain = float(configs.get('Gain settings',
-                                           'iv left gain'))
+    lockin_topo.ivgain = gains['iv topo gain']
+    lockin_right.ivgain = gains['iv right gain']
+    lockin_left.ivgain = gains['iv left gain']
 
 
 def reload_QDAC_settings():
@@ -170,17 +259,13 @@ def reload_QDAC_settings():
     Function to update the qdac based on the configuration file
     """
 
-    configs = Config.default
-    configs.reload()
+    snapshot = config_snapshot()
     station = qc.Station.default
 
     # Update the voltage dividers
-    topo_dc = float(configs.get('Gain settings',
-                                'dc factor topo'))
-    # sens_r_dc = float(configs.get('Gain settings',
-    #                               'dc factor right'))
-    # sens_l_dc = float(configs.get('Gain settings',
-    #                               'dc factor left'))
+    topo_dc = snapshot.gains['dc factor topo']
+    # sens_r_dc = snapshot.gains['dc factor right']
+    # sens_l_dc = snapshot.gains['dc factor left']
     qdac = station['qdac']
     qdac.topo_bias.division_value = topo_dc
     # qdac.sens_r_bias.division_value = sens_r_dc
@@ -188,24 +273,119 @@ def reload_QDAC_settings():
 
     # Set the range validators
     # NB: This is the voltage AT the QDac, BEFORE votlage dividers
-    ranges = configs.get('Channel ranges')
-    for chan in range(1, 49):
-        try:
-            chan_range = ranges[str(chan)]
-        except KeyError:
+    for chan in range(1, QDAC_N_CHANNELS+1):
+        rangemin, rangemax = snapshot.ranges[chan]
+        if np.isnan(rangemin):
             continue
 
-        minmax = chan_range.split(" ")
-        if len(minmax) != 2:
-            raise ValueError("Expected: min max. Got {}".format(chan_range))
-        else:
-            rangemin = float(minmax[0])
-            rangemax = float(minmax[1])
-
-        vldtr = Numbers(rangemin, rangemax)
+        vldtr = Numbers(float(rangemin), float(rangemax))
         qdac.channels[chan-1].v.set_validator(vldtr)
+        qdac.ranges[chan] = (rangemin, rangemax)
 
     # Update the channels' labels
-    labels = channel_labels()
-    for chan, label in labels.items():
+    for chan, label in snapshot.channel_labels().items():
         qdac.channels[chan-1].v.label = label
+
+
+# Which instrument attributes depend on which field of the 'Gain settings'
+# section. Targets are (station component, attribute path)
+GAIN_TARGETS = {
+    'iv topo gain': (('lockin_topo', 'ivgain'),
+                     ('keysight_dmm_top', 'iv_conv')),
+    'iv right gain': (('lockin_r', 'ivgain'),),
+    'iv left gain': (('lockin_l', 'ivgain'),),
+    'ac factor topo': (('lockin_topo', 'acfactor'),),
+    'ac factor right': (('lockin_r', 'acfactor'),),
+    'ac factor left': (('lockin_l', 'acfactor'),),
+    'dc factor topo': (('qdac', 'topo_bias.division_value'),),
+}
+
+
+def _set_nested_attr(obj, path, value):
+    """
+    setattr for a dotted attribute path, e.g. 'topo_bias.division_value'
+    """
+    *parents, attr = path.split('.')
+    for name in parents:
+        obj = getattr(obj, name)
+    setattr(obj, attr, value)
+
+
+def apply_settings_changes(old, new, station=None):
+    """
+    Push the differences between two config snapshots to the instruments
+    of the station. Only the labels, validators and gain factors that
+    changed are touched; instruments missing from the station are skipped.
+
+    None of the updates talk to the instruments, they only change the
+    host-side labels, validators and conversion factors.
+
+    A range or label removed from the config is reset to the QDac default
+    (+-QDAC_MAX_VOLTAGE, 'Channel n voltage'). A removed gain has no
+    default, so the instruments keep the old value and a warning is
+    logged.
+
+    Args:
+        old (ConfigSnapshot): The snapshot the instruments are set up with
+        new (ConfigSnapshot): The new snapshot
+        station (Optional[Station]): Default: the default station
+
+    Returns:
+        list: Descriptions of the applied updates
+    """
+    if station is None:
+        station = qc.Station.default
+
+    components = station.components
+    applied = []
+
+    for key in old.gains:
+        if key in new.gains:
+            continue
+        targets = [(comp, path) for comp, path in GAIN_TARGETS.get(key, ())
+                   if comp in components]
+        if targets:
+            log.warning('{!r} was removed from the config, keeping {} for '
+                        '{}'.format(key, old.gains[key], ', '.join(
+                            '{}.{}'.format(comp, path)
+                            for comp, path in targets)))
+
+    for key, val in new.gains.items():
+        if old.gains.get(key) == val:
+            continue
+        for comp, path in GAIN_TARGETS.get(key, ()):
+            if comp not in components:
+                continue
+            _set_nested_attr(components[comp], path, val)
+            applied.append('{}.{} = {}'.format(comp, path, val))
+
+    qdac = components.get('qdac')
+    if qdac is None:
+        return applied
+
+    # NB: This is the voltage AT the QDac, BEFORE voltage dividers
+    same = ((old.ranges == new.ranges) |
+            (np.isnan(old.ranges) & np.isnan(new.ranges))).all(axis=1)
+    for chan in np.flatnonzero(~same):
+        rangemin, rangemax = new.ranges[chan]
+        if np.isnan(rangemin):
+            # Removed from the config
+            rangemin, rangemax = -QDAC_MAX_VOLTAGE, QDAC_MAX_VOLTAGE
+            log.warning('The range of qdac channel {} was removed from the '
+                        'config, resetting it to the default'.format(chan))
+        vldtr = Numbers(float(rangemin), float(rangemax))
+        qdac.channels[chan-1].v.set_validator(vldtr)
+        qdac.ranges[chan] = (rangemin, rangemax)
+        applied.append('qdac channel {} range = {}'.format(chan, vldtr))
+
+    for chan in np.flatnonzero(old.labels != new.labels):
+        label = new.labels[chan]
+        if label is None:
+            # Removed from the config
+            label = 'Channel {} voltage'.format(chan)
+            log.warning('The label of qdac channel {} was removed from the '
+                        'config, resetting it to the default'.format(chan))
+        qdac.channels[chan-1].v.label = label
+        applied.append('qdac channel {} label = {}'.format(chan, label))
+
+    return applied
@@ -0,0 +1,892 @@
+# -*- coding: utf-8 -*-
+"""
+Simulated drop-ins for the T10 instruments, for profiling and regression
+testing the wrappers without hardware.
+
+The simulated instruments subclass the T10 instruments, but replace the
+communication with an in-memory model, so that isinstance checks in the
+wrappers keep working. Every parameter get/set and raw command sleeps a
+configurable latency, and the measured signals come from a synthetic
+device with Coulomb peaks whose gate voltages are those of the simulated
+QDac (including ongoing ramps).
+
+Example:
+    config = Config('sample.config')
+    station = simulated_station(config, latency=0)
+    reload_QDAC_settings()
+    reload_SR830_settings()
+"""
+import logging
+import re
+import time
+
+import numpy as np
+
+import qcodes as qc
+from qcodes import Instrument
+from qcodes.instrument.parameter import MultiParameter
+from qcodes.instrument_drivers.stanford_research.SR830 import ChannelBuffer
+from qcodes.utils.validators import Numbers, Enum, Ints
+
+from configreader import QDAC_N_CHANNELS
+from customised_instruments import (QDAC_T10, SR830_T10, Keysight_34465A_T10,
+                                    ZIUHFLI_T10)
+
+log = logging.getLogger(__name__)
+
+# (Ohm)
+RESISTANCE_QUANTUM = 25.818e3
+
+# The SR830 buffer holds at most this many points
+SR830_BUFFER_SIZE = 16383
+
+# The QDac serial link runs at 480600 baud, 10 bits per byte (bytes/s)
+QDAC_THROUGHPUT = 48060
+
+
+class SimulatedDevice:
+    """
+    Synthetic quantum dot: Coulomb peaks as a function of a weighted sum
+    of the gate voltages.
+
+    The conductance (e^2/h) is g_max/cosh^2 of the distance to the nearest
+    peak in units of the peak width, plus Gaussian noise.
+
+    Args:
+        qdac (Optional[SimQDac]): The QDac whose voltages define the device
+            state. Can be assigned later.
+        lever_arms (Optional[dict]): Weight of each QDac channel in the
+            effective gate voltage. Default: 0.1 for every channel.
+        peak_spacing (float): Spacing of the peaks in effective voltage (V)
+        peak_width (float): Width of the peaks in effective voltage (V)
+        g_max (float): Peak height (e^2/h)
+        noise (float): Standard deviation of the noise (e^2/h)
+        seed (Optional[int]): Seed of the noise
+    """
+
+    def __init__(self, qdac=None, lever_arms=None, peak_spacing=5e-3,
+                 peak_width=2e-4, g_max=1.0, noise=0.01, seed=None):
+        self.qdac = qdac
+        self.peak_spacing = peak_spacing
+        self.peak_width = peak_width
+        self.g_max = g_max
+        self.noise = noise
+        self._rng = np.random.RandomState(seed)
+
+        self.lever_arms = np.full(QDAC_N_CHANNELS+1, 0.1)
+        self.lever_arms[0] = 0
+        if lever_arms is not None:
+            self.lever_arms[:] = 0
+            for chan, arm in lever_arms.items():
+                self.lever_arms[chan] = arm
+
+    def conductance(self, voltages):
+        """
+        The conductance for the given gate voltages
+
+        Args:
+            voltages (numpy.ndarray): Gate voltages indexed by channel along
+                the last axis, i.e. shape (..., QDAC_N_CHANNELS+1)
+
+        Returns:
+            numpy.ndarray: The conductance (e^2/h), shape voltages.shape[:-1]
+        """
+        veff = np.asarray(voltages) @ self.lever_arms
+        detuning = veff - self.peak_spacing*np.round(veff/self.peak_spacing)
+        g = self.g_max/np.cosh(detuning/self.peak_width)**2
+        if self.noise:
+            g = g + self.noise*self._rng.standard_normal(np.shape(g))
+        return g
+
+    def conductance_at(self, t):
+        """
+        The conductance at the (time.perf_counter) time(s) t
+        """
+        if self.qdac is None:
+            raise ValueError('The device is not connected to a QDac')
+        return self.conductance(self.qdac.voltages_at(t))
+
+
+class _SimulatedLatency:
+    """
+    Mixin sleeping a configurable latency for every simulated command
+
+    Attributes:
+        latency (float): The default latency of a command (s)
+        command_latency (dict): Latencies of specific commands (parameter
+            names or raw command headers), overriding the default
+    """
+
+    def _init_latency(self, latency, command_latency):
+        self.latency = latency
+        self.command_latency = dict(command_latency or {})
+
+    def _wait(self, command):
+        delay = self.command_latency.get(command, self.latency)
+        if delay:
+            time.sleep(delay)
+
+    def _init_visa(self, handle):
+        """
+        Attach a simulated visa handle, with the attributes the
+        VisaInstrument methods (e.g. snapshot_base) expect
+        """
+        self.visa_handle = handle
+        self._address = 'simulated'
+        self._terminator = ''
+        self.add_parameter('timeout', unit='s',
+                           get_cmd=self._get_visa_timeout,
+                           set_cmd=self._set_visa_timeout)
+
+    def _add_sim_parameter(self, name, initial=None, get_func=None,
+                           set_func=None, **kwargs):
+        """
+        Add a parameter whose value lives in memory. get_func/set_func
+        replace the plain storage where the value is computed or has side
+        effects.
+        """
+        self._sim_values[name] = initial
+
+        def get_cmd():
+            self._wait(name)
+            if get_func is not None:
+                return get_func()
+            return self._sim_values[name]
+
+        def set_cmd(value):
+            self._wait(name)
+            if set_func is not None:
+                set_func(value)
+            self._sim_values[name] = value
+
+        self.add_parameter(name, get_cmd=get_cmd, set_cmd=set_cmd, **kwargs)
+
+
+class _SimVisaHandle:
+    """
+    Stand-in for a pyvisa resource, answering queries through a command
+    handler of the instrument
+
+    Args:
+        handler (Callable): Executes a command, returns the reply, a list
+            of reply lines or None
+        throughput (Optional[float]): Bus throughput (bytes/s). Reading a
+            reply then takes its length over the throughput.
+    """
+
+    def __init__(self, handler, throughput=None):
+        self._handler = handler
+        self._responses = []
+        self.timeout = 5000
+        self.throughput = throughput
+
+    def _transfer(self, response):
+        if self.throughput:
+            time.sleep(len(response)/self.throughput)
+        return response
+
+    def write(self, cmd):
+        response = self._handler(cmd)
+        if isinstance(response, list):
+            self._responses.extend(response)
+        elif response is not None:
+            self._responses.append(response)
+        return len(cmd), 0
+
+    def read_raw(self):
+        response = self._responses.pop(0)
+        if isinstance(response, str):
+            response = (response + '\n').encode()
+        return self._transfer(response)
+
+    def read(self):
+        response = self._responses.pop(0)
+        if isinstance(response, bytes):
+            response = response.decode()
+        return self._transfer(response)
+
+    def ask(self, cmd):
+        self.write(cmd)
+        return self.read()
+
+    query = ask
+
+    def clear(self):
+        self._responses = []
+
+    def close(self):
+        pass
+
+
+def _parse_command(cmd):
+    """
+    Split a raw command like 'TRCA ? 1, 0, 100' into
+    ('TRCA', True, ['1', '0', '100'])
+    """
+    match = re.match(r'\s*([*\w]+)\s*(\?)?\s*(.*)', cmd)
+    header, query, args = match.groups()
+    args = [arg.strip() for arg in args.split(',') if arg.strip()]
+    return header.upper(), query is not None, args
+
+
+##################################################
+# QDac
+
+
+class SimQDac(_SimulatedLatency, QDAC_T10):
+    """
+    A simulated QDAC_T10.
+
+    The QDac driver runs unchanged on a simulated serial link, which
+    answers the commands the driver sends (status, set, wav, fun, syn, vol,
+    cur, get, tem, ver), so that channel names, function generator
+    bookkeeping and the cost of status queries are those of the real
+    instrument. Voltages ramp linearly when a function generator runs a
+    ramp.
+
+    Args:
+        name (str): The instrument name
+        config (Config): The config object (for the named channels)
+        latency (float): Default latency of a command (s)
+        command_latency (Optional[dict]): Per-command latencies (s), by
+            command header, e.g. 'status'
+        throughput (Optional[float]): Serial throughput (bytes/s), to
+            account for the size of the replies, e.g. of a status query
+    """
+
+    def __init__(self, name, config, latency=5e-3, command_latency=None,
+                 throughput=None, **kwargs):
+        self._init_latency(latency, command_latency)
+        self._throughput = throughput
+        # Output of each channel: ramp from v_from at t_from to v_to at
+        # t_to (V, time.perf_counter time), before the attenuator
+        self._outputs = {ch: [0.0, 0.0, 0.0, 0.0]
+                         for ch in range(1, QDAC_N_CHANNELS+1)}
+        self._attenuated = set()
+        # Function generator and raw amplitude, offset of each channel
+        self._waveforms = {}
+        super().__init__(name, 'ASRL1::INSTR', config,
+                         num_chans=QDAC_N_CHANNELS, **kwargs)
+
+    def set_address(self, address):
+        self.visa_handle = _SimVisaHandle(self._handle_command,
+                                          self._throughput)
+        self._address = address
+
+    def _raw_at(self, ch, t):
+        """
+        The raw output (before the attenuator) of channel ch at the
+        (time.perf_counter) time(s) t
+        """
+        v_from, v_to, t_from, t_to = self._outputs[ch]
+        if t_to <= t_from:
+            return np.where(np.asarray(t) < t_from, v_from, v_to)
+        fraction = np.clip((np.asarray(t) - t_from)/(t_to - t_from), 0, 1)
+        return v_from + fraction*(v_to - v_from)
+
+    def voltages_at(self, t):
+        """
+        The voltages of all channels at the time(s) t, indexed by channel
+        along the last axis
+        """
+        t = np.asarray(t)
+        voltages = np.zeros(t.shape + (QDAC_N_CHANNELS+1,))
+        for ch in self._outputs:
+            atten = 0.1 if ch in self._attenuated else 1
+            voltages[..., ch] = atten*self._raw_at(ch, t)
+        return voltages
+
+    def _hold(self, ch, now):
+        """
+        Stop the channel at its present output
+        """
+        v = float(self._raw_at(ch, now))
+        self._outputs[ch] = [v, v, now, now]
+
+    def _status_reply(self, now):
+        lines = ['Software Version: 0.170202',
+                 'Channel\tOut V\t\tVoltage range\tCurrent range',
+                 '']
+        for ch in self._outputs:
+            vrange = 'X 0.1' if ch in self._attenuated else 'X 1'
+            lines.append('{}\t{:f}\t\t{}\t\tlo cur'.format(
+                ch, float(self._raw_at(ch, now)), vrange))
+        return lines
+
+    def _handle_command(self, cmd):
+        """
+        Execute a raw command, of which several may be joined by ';'.
+        Returns the reply lines; every command gets at least one.
+        """
+        replies = []
+        for part in cmd.split(';'):
+            words = part.split()
+            if not words:
+                continue
+            self._wait(words[0])
+            now = time.perf_counter()
+            args = [float(word) for word in words[1:]]
+
+            if words[0] == 'status':
+                replies.extend(self._status_reply(now))
+                continue
+            elif words[0] == 'set':
+                ch = int(args[0])
+                self._waveforms.pop(ch, None)
+                self._outputs[ch] = [args[1], args[1], now, now]
+            elif words[0] == 'wav':
+                ch, fg = int(args[0]), int(args[1])
+                self._hold(ch, now)
+                if fg:
+                    self._waveforms[ch] = (fg, args[2], args[3])
+                else:
+                    self._waveforms.pop(ch, None)
+            elif words[0] == 'fun':
+                fg, period = int(args[0]), args[2]*1e-3
+                for ch, (ch_fg, amplitude, offset) in self._waveforms.items():
+                    if ch_fg == fg:
+                        self._outputs[ch] = [offset, offset + amplitude,
+                                             now, now + period]
+            elif words[0] == 'vol':
+                ch = int(args[0])
+                if args[1]:
+                    self._attenuated.add(ch)
+                else:
+                    self._attenuated.discard(ch)
+            elif words[0] in ('cur', 'get') and len(args) == 1:
+                replies.append('0')
+                continue
+            elif words[0] == 'tem':
+                replies.append('25.0')
+                continue
+            elif words[0] not in ('syn', 'cur', 'ver'):
+                log.debug('SimQDac ignoring command {!r}'.format(part))
+            replies.append('')
+        return replies
+
+    def close(self):
+        Instrument.close(self)
+
+
+##################################################
+# SR830
+
+
+class SimSR830(_SimulatedLatency, SR830_T10):
+    """
+    A simulated SR830_T10 measuring the conductance of a SimulatedDevice.
+
+    The X output is the current through the device for the excitation
+    amplitude/acfactor, times ivgain, so that the g parameter recovers the
+    device conductance. The data buffer supports trigger and internal-rate
+    sampling and the ASCII (TRCA) and binary (TRCB, TRCL) transfers.
+
+    Args:
+        name (str): The instrument name
+        device (SimulatedDevice): The device to measure
+        latency (float): Default latency of a command (s)
+        command_latency (Optional[dict]): Per-command latencies (s)
+        throughput (Optional[float]): GPIB throughput (bytes/s), to account
+            for the size of the replies
+    """
+
+    # buffer_SR values of the SR830 driver
+    _sample_rates = [62.5e-3, 0.125, 0.250, 0.5, 1, 2, 4, 8, 16, 32, 64,
+                     128, 256, 512, 'Trigger']
+
+    def __init__(self, name, device, latency=5e-3, command_latency=None,
+                 throughput=None, **kwargs):
+        Instrument.__init__(self, name, **kwargs)
+        self._init_latency(latency, command_latency)
+        self._sim_values = {}
+        self.device = device
+        self._init_visa(_SimVisaHandle(self._handle_command, throughput))
+
+        self._add_sim_parameter('amplitude', 0.1, unit='V',
+                                vals=Numbers(0.004, 5.0))
+        self._add_sim_parameter('frequency', 17.77, unit='Hz',
+                                vals=Numbers(1e-3, 102e3))
+        self._add_sim_parameter('phase', 0.0, unit='deg',
+                                vals=Numbers(-360, 729.99))
+        self._add_sim_parameter('time_constant', 0.1, unit='s',
+                                vals=Numbers(10e-6, 30e3))
+        self._add_sim_parameter('sensitivity', 1.0, unit='V',
+                                vals=Numbers(2e-9, 1))
+        for ch in (1, 2):
+            display = 'X' if ch == 1 else 'Y'
+            self._add_sim_parameter('ch{}_display'.format(ch), display,
+                                    vals=Enum('X', 'Y', 'R', 'Phase',
+                                              'X Noise', 'Y Noise',
+                                              'Aux In 1', 'Aux In 2',
+                                              'Aux In 3', 'Aux In 4'))
+            self._add_sim_parameter('ch{}_ratio'.format(ch), 'none',
+                                    vals=Enum('none', 'Aux In 1',
+                                              'Aux In 2'))
+
+        for quantity in ('X', 'Y', 'R', 'P'):
+            self.add_parameter(quantity,
+                               unit='deg' if quantity == 'P' else 'V',
+                               get_cmd=lambda q=quantity: self._output(q))
+
+        # Start and (if paused) pause time of the internal-rate sampling
+        self._buffer_t0 = None
+        self._buffer_paused = None
+        self._buffer_triggers = []
+        self._add_sim_parameter('buffer_SR', 'Trigger', unit='Hz',
+                                vals=Enum(*self._sample_rates))
+        self._add_sim_parameter('buffer_acq_mode', 'Single shot',
+                                vals=Enum('Single shot', 'Loop'))
+        self._add_sim_parameter('buffer_trig_mode', 'OFF',
+                                vals=Enum('ON', 'OFF'))
+        self.add_parameter('buffer_npts',
+                           get_cmd=lambda: int(self.ask('SPTS?')))
+        self.add_function('buffer_start', call_cmd='STRT')
+        self.add_function('buffer_pause', call_cmd='PAUS')
+        self.add_function('buffer_reset', call_cmd='REST')
+        self.add_function('send_trigger', call_cmd='TRIG')
+
+        self._buffer1_ready = False
+        self._buffer2_ready = False
+        self.add_parameter('ch1_databuffer', channel=1,
+                           parameter_class=ChannelBuffer)
+        self.add_parameter('ch2_databuffer', channel=2,
+                           parameter_class=ChannelBuffer)
+
+        self._add_t10_parameters()
+
+    def write_raw(self, cmd):
+        self.visa_handle.write(cmd)
+
+    def ask_raw(self, cmd):
+        return self.visa_handle.ask(cmd)
+
+    def _excitation(self):
+        return self._sim_values['amplitude']/self.acfactor
+
+    def _outputs_at(self, t):
+        """
+        X, Y, R and P for the (array of) time(s) t
+        """
+        g = self.device.conductance_at(t)
+        x = g/RESISTANCE_QUANTUM*self._excitation()*self.ivgain
+        y = 1e-2*x
+        r = np.hypot(x, y)
+        p = np.degrees(np.arctan2(y, x))
+        return {'X': x, 'Y': y, 'R': r, 'P': p}
+
+    def _output(self, quantity):
+        self._wait(quantity)
+        return float(self._outputs_at(time.perf_counter())[quantity])
+
+    def _buffer_times(self):
+        """
+        The sample times of the points currently in the buffer
+        """
+        rate = self._sim_values['buffer_SR']
+        if rate == 'Trigger':
+            return np.array(self._buffer_triggers)
+        if self._buffer_t0 is None:
+            return np.array([])
+        end = self._buffer_paused or time.perf_counter()
+        npts = int((end - self._buffer_t0)*rate)
+        if self._sim_values['buffer_acq_mode'] == 'Single shot':
+            npts = min(npts, SR830_BUFFER_SIZE)
+        else:
+            npts = npts % SR830_BUFFER_SIZE
+        return self._buffer_t0 + np.arange(npts)/rate
+
+    def _buffer_data(self, channel, start, npts):
+        display = self._sim_values['ch{}_display'.format(channel)]
+        outputs = self._outputs_at(self._buffer_times()[start:start+npts])
+        return outputs.get(display[0], outputs['X'])
+
+    def _handle_command(self, cmd):
+        """
+        Execute a raw command. Returns the response of queries.
+        """
+        header, query, args = _parse_command(cmd)
+        self._wait(header)
+
+        if header == 'STRT':
+            now = time.perf_counter()
+            if self._buffer_t0 is None:
+                self._buffer_t0 = now
+            elif self._buffer_paused is not None:
+                # Resume where the pause stopped the sampling
+                self._buffer_t0 += now - self._buffer_paused
+            self._buffer_paused = None
+        elif header == 'PAUS':
+            if self._buffer_t0 is not None and self._buffer_paused is None:
+                self._buffer_paused = time.perf_counter()
+        elif header == 'REST':
+            self._buffer_t0 = None
+            self._buffer_paused = None
+            self._buffer_triggers = []
+        elif header == 'TRIG':
+            if len(self._buffer_triggers) < SR830_BUFFER_SIZE:
+                self._buffer_triggers.append(time.perf_counter())
+        elif header == 'SPTS' and query:
+            return str(len(self._buffer_times()))
+        elif header == '*IDN' and query:
+            return 'Stanford_Research_Systems,SR830,s/n00000,ver1.07'
+        elif header in ('TRCA', 'TRCB', 'TRCL') and query:
+            data = self._buffer_data(int(args[0]), int(args[1]),
+                                     int(args[2]))
+            if header == 'TRCA':
+                return ''.join('{:e},'.format(val) for val in data)
+            if header == 'TRCB':
+                return np.asarray(data, dtype='<f4').tobytes()
+            return _encode_trcl(data)
+        elif header == 'SNAP' and query:
+            outputs = self._outputs_at(time.perf_counter())
+            names = {1: 'X', 2: 'Y', 3: 'R', 4: 'P'}
+            return ','.join('{:e}'.format(float(outputs[names[int(arg)]]))
+                            for arg in args)
+        elif header == 'OUTP' and query:
+            names = {1: 'X', 2: 'Y', 3: 'R', 4: 'P'}
+            return '{:e}'.format(self._output(names[int(args[0])]))
+        elif query:
+            return '0'
+        return None
+
+    def close(self):
+        Instrument.close(self)
+
+
+def _encode_trcl(data):
+    """
+    Encode values in the non-normalised binary format of the SR830 TRCL
+    command: little-endian int16 mantissa and int16 exponent per point,
+    value = mantissa*2**(exponent-124)
+    """
+    data = np.asarray(data, dtype=float)
+    exponent = np.zeros(len(data), dtype='<i2')
+    nonzero = data != 0
+    exponent[nonzero] = (np.floor(np.log2(np.abs(data[nonzero]))) +
+                         124 - 14).astype(int)
+    mantissa = np.round(data/2.0**(exponent.astype(float)-124))
+    packed = np.empty((len(data), 2), dtype='<i2')
+    packed[:, 0] = mantissa
+    packed[:, 1] = exponent
+    return packed.tobytes()
+
+
+##################################################
+# Keysight 34465A
+
+
+class SimKeysight_34465A(_SimulatedLatency, Keysight_34465A_T10):
+    """
+    A simulated Keysight_34465A_T10 reading the DC current through the
+    device, biased by the topo bias channel of the QDac, after the
+    I-V converter.
+
+    Args:
+        name (str): The instrument name
+        device (SimulatedDevice): The device to measure
+        latency (float): Default latency of a command (s). A reading
+            additionally takes NPLC power line cycles.
+        command_latency (Optional[dict]): Per-command latencies (s)
+    """
+
+    def __init__(self, name, device, latency=2e-3, command_latency=None,
+                 **kwargs):
+        Instrument.__init__(self, name, **kwargs)
+        self._init_latency(latency, command_latency)
+        self._sim_values = {}
+        self.device = device
+        # Every setting lives in a simulated parameter
+        self._init_visa(_SimVisaHandle(lambda cmd: None))
+
+        self._add_sim_parameter('NPLC', 0.02,
+                                vals=Enum(0.02, 0.06, 0.2, 1, 10, 100))
+        self._add_sim_parameter('volt', get_func=self._get_volt, unit='V')
+
+        self._add_t10_parameters()
+
+    def _get_volt(self):
+        time.sleep(self._sim_values['NPLC']/50)
+        qdac = self.device.qdac
+        bias = qdac.topo_bias.v1.get_latest()/qdac.topo_bias.division_value
+        g = float(self.device.conductance_at(time.perf_counter()))
+        return g/RESISTANCE_QUANTUM*bias*self.iv_conv
+
+    def close(self):
+        Instrument.close(self)
+
+
+##################################################
+# Keysight 33500B
+
+
+class SimKeysight_33500B(_SimulatedLatency, Instrument):
+    """
+    A simulated Keysight 33500B function generator with the parameters
+    used by fast_charge_diagram and the pulsed experiments.
+
+    Args:
+        name (str): The instrument name
+        latency (float): Default latency of a command (s)
+        command_latency (Optional[dict]): Per-command latencies (s)
+    """
+
+    def __init__(self, name, latency=2e-3, command_latency=None, **kwargs):
+        super().__init__(name, **kwargs)
+        self._init_latency(latency, command_latency)
+        self._sim_values = {}
+
+        for ch in (1, 2):
+            for par, initial in [('function_type', 'SIN'),
+                                 ('ramp_symmetry', 100),
+                                 ('phase', 0), ('amplitude_unit', 'VPP'),
+                                 ('amplitude', 0.1), ('offset', 0),
+                                 ('frequency', 1e3), ('output', 'OFF'),
+                                 ('trigger_source', 'IMM'),
+                                 ('trigger_delay', 0),
+                                 ('trigger_slope', 'POS'),
+                                 ('burst_mode', 'N Cycle'),
+                                 ('burst_ncycles', 1), ('burst_phase', 0),
+                                 ('burst_state', 'OFF')]:
+                self._add_sim_parameter('ch{}_{}'.format(ch, par), initial)
+        self._add_sim_parameter('sync_source', 1)
+        self._add_sim_parameter('sync_output', 'OFF')
+
+    def write_raw(self, cmd):
+        self._wait(cmd)
+
+    def ask_raw(self, cmd):
+        self._wait(cmd)
+        return '0'
+
+    def ramp_voltages(self, channel, npts):
+        """
+        The voltages of one period of a ramp output sampled at npts points
+        """
+        amplitude = self._sim_values['ch{}_amplitude'.format(channel)]
+        offset = self._sim_values['ch{}_offset'.format(channel)]
+        return np.linspace(offset - amplitude/2, offset + amplitude/2, npts)
+
+
+##################################################
+# ZI UHF-LI
+
+
+class _SimScope(MultiParameter):
+    """
+    The simulated scope. Returns a (segments, length) array per channel.
+    """
+
+    def __init__(self, name, instrument, **kwargs):
+        super().__init__(name, names=('ch1', 'ch2'), shapes=((1,), (1,)),
+                         instrument=instrument, **kwargs)
+        self.units = ('V', 'V')
+
+    def prepare_scope(self):
+        zi = self._instrument
+        zi._wait('prepare_scope')
+        shape = (zi.scope_segments_count.get_latest(),
+                 zi.scope_length.get_latest())
+        self.shapes = (shape, shape)
+
+    def get(self):
+        return self._instrument._scope_traces()
+
+
+class SimZIUHFLI(_SimulatedLatency, ZIUHFLI_T10):
+    """
+    A simulated ZIUHFLI_T10 whose scope records the device conductance
+    while a Keysight ramp sweeps one QDac channel.
+
+    Args:
+        name (str): The instrument name
+        device (SimulatedDevice): The device to measure
+        keysight (Optional[SimKeysight_33500B]): The generator of the ramp
+        fast_channel (Optional[int]): The QDac channel the ramp adds to
+        latency (float): Default latency of a command (s)
+        command_latency (Optional[dict]): Per-command latencies (s)
+    """
+
+    _sampling_rates = ['1.80 GHz', '900 MHz', '450 MHz', '225 MHz',
+                       '113 MHz', '56.2 MHz', '28.1 MHz', '14.0 MHz',
+                       '7.03 MHz', '3.50 MHz', '1.75 MHz', '880 kHz',
+                       '440 kHz', '220 kHz', '110 kHz', '54.9 kHz',
+                       '27.5 kHz']
+
+    def __init__(self, name, device, keysight=None, fast_channel=None,
+                 latency=1e-3, command_latency=None, **kwargs):
+        Instrument.__init__(self, name, **kwargs)
+        self._init_latency(latency, command_latency)
+        self._sim_values = {}
+        self.device = device
+        self.keysight = keysight
+        self.fast_channel = fast_channel
+
+        self._add_sim_parameter('scope_samplingrate', '14.0 MHz',
+                                vals=Enum(*self._sampling_rates))
+        self._add_sim_parameter('scope_length', 4096, vals=Ints(4096, 128000))
+        self.add_parameter('scope_duration', unit='s',
+                           get_cmd=self._scope_duration)
+        for par, initial in [('scope_channels', 3), ('scope_mode',
+                                                     'Time Domain'),
+                             ('scope_channel1_input', 'Signal Input 1'),
+                             ('scope_channel2_input', 'Signal Input 2'),
+                             ('scope_trig_enable', 'ON'),
+                             ('scope_trig_signal', 'Trig Input 1'),
+                             ('scope_trig_slope', 'Rise'),
+                             ('scope_trig_hystmode', 'absolute'),
+                             ('scope_trig_hystabsolute', 0),
+                             ('scope_trig_gating_enable', 'OFF'),
+                             ('scope_trig_holdoffmode', 's'),
+                             ('scope_trig_holdoffseconds', 60e-6),
+                             ('scope_trig_reference', 0),
+                             ('scope_trig_level', 0.5),
+                             ('scope_trig_delay', 0),
+                             ('scope_segments', 'OFF'),
+                             ('scope_segments_count', 1)]:
+            self._add_sim_parameter(par, initial)
+        for osc in (1, 2):
+            self._add_sim_parameter('oscillator{}_freq'.format(osc), 1e6)
+        for demod in range(1, 9):
+            self._add_sim_parameter('demod{}_order'.format(demod), 1)
+            self._add_sim_parameter('demod{}_timeconstant'.format(demod),
+                                    1e-3)
+            self._add_sim_parameter('demod{}_signalin'.format(demod),
+                                    'Sig In 1')
+        for out in (1, 2):
+            for par, initial in [('ampdef', 'Vpk'), ('amplitude', 0),
+                                 ('offset', 0), ('on', 'OFF')]:
+                self._add_sim_parameter('signal_output{}_{}'.format(out, par),
+                                        initial)
+
+        self.add_parameter('Scope', parameter_class=_SimScope)
+        self.daq = self
+        self._add_t10_parameters()
+
+    def sync(self):
+        """
+        Stand-in for the daq.sync of the ziPython session
+        """
+        self._wait('sync')
+
+    def _scope_duration(self):
+        rate = self._sim_values['scope_samplingrate']
+        value, unit = rate.split()
+        factor = {'GHz': 1e9, 'MHz': 1e6, 'kHz': 1e3}[unit]
+        return self._sim_values['scope_length']/(float(value)*factor)
+
+    def _scope_traces(self):
+        segments = self._sim_values['scope_segments_count']
+        if self._sim_values['scope_segments'] == 'OFF':
+            segments = 1
+        length = self._sim_values['scope_length']
+
+        # The acquisition takes as long as on the real instrument
+        time.sleep(segments*(self._scope_duration() +
+                             self._sim_values['scope_trig_holdoffseconds']))
+
+        voltages = self.device.qdac.voltages_at(time.perf_counter())
+        voltages = np.tile(voltages, (segments, length, 1))
+        if self.keysight is not None and self.fast_channel is not None:
+            voltages[..., self.fast_channel] += self.keysight.ramp_voltages(
+                1, length)
+        signal = 1e-3*self.device.conductance(voltages)
+
+        return (signal, signal.copy())
+
+    def close(self):
+        Instrument.close(self)
+
+
+##################################################
+# Tektronix AWG5014
+
+
+class SimTektronix_AWG5014(_SimulatedLatency, Instrument):
+    """
+    A simulated Tektronix AWG5014 with the parameters used by the pulsed
+    experiments. Uploading a sequence takes upload_time per MB of
+    waveform data and switches the outputs off, as on the real instrument.
+
+    Args:
+        name (str): The instrument name
+        latency (float): Default latency of a command (s)
+        upload_time (float): Upload time per MB of waveform data (s)
+        command_latency (Optional[dict]): Per-command latencies (s)
+    """
+
+    def __init__(self, name, latency=2e-3, upload_time=1.0,
+                 command_latency=None, **kwargs):
+        super().__init__(name, **kwargs)
+        self._init_latency(latency, command_latency)
+        self._sim_values = {}
+        self.upload_time = upload_time
+
+        self._add_sim_parameter('clock_freq', 1.2e9, unit='Hz',
+                                vals=Numbers(1e7, 1.2e9))
+        for ch in range(1, 5):
+            self._add_sim_parameter('ch{}_amp'.format(ch), 0.5, unit='V')
+            self._add_sim_parameter('ch{}_offset'.format(ch), 0, unit='V')
+            self._add_sim_parameter('ch{}_state'.format(ch), 0,
+                                    vals=Enum(0, 1))
+            self._add_sim_parameter('ch{}_add_input'.format(ch), '""')
+        self._add_sim_parameter('state', 'Idle')
+        self.add_function('run', call_cmd=lambda: self.state.set('Running'))
+        self.add_function('stop', call_cmd=lambda: self.state.set('Idle'))
+
+    def make_send_and_load_awg_file(self, *args, channels=None, **kwargs):
+        """
+        Simulated upload of a sequence (see the AWG5014 driver)
+        """
+        nbytes = sum(np.asarray(arg).nbytes for arg in args
+                     if isinstance(arg, (list, np.ndarray)))
+        time.sleep(self.latency + self.upload_time*nbytes/1e6)
+        for ch in range(1, 5):
+            self._sim_values['ch{}_state'.format(ch)] = 0
+
+
+def simulated_station(config, device=None, latency=None, seed=None,
+                      fast_channel=3):
+    """
+    Make a station of simulated T10 instruments, named as in
+    Experiment_init, and make it the default station.
+
+    Args:
+        config (Config): The config object
+        device (Optional[SimulatedDevice]): Default: a SimulatedDevice with
+            the given seed
+        latency (Optional[float]): If given, the latency (s) of every
+            command of every instrument. Default: typical latencies of the
+            real instruments.
+        seed (Optional[int]): Seed of the device noise
+        fast_channel (Optional[int]): The QDac channel the ramp of
+            keysight_gen_left adds to, as in fast_charge_example. None for
+            a scope that only sees the QDac voltages.
+
+    Returns:
+        Station: The station with components qdac, lockin_topo, lockin_l,
+            lockin_r, keysight_dmm_top, keysight_gen_left, ziuhfli and AWG1
+    """
+    if device is None:
+        device = SimulatedDevice(seed=seed)
+
+    kwargs = {} if latency is None else {'latency': latency}
+
+    # With the typical latencies, a status query takes as long as the
+    # transfer of its 51 lines
+    qdac = SimQDac('qdac', config,
+                   throughput=QDAC_THROUGHPUT if latency is None else None,
+                   **kwargs)
+    device.qdac = qdac
+    keysight = SimKeysight_33500B('keysight_gen_left', **kwargs)
+
+    instruments = [qdac,
+                   SimSR830('lockin_topo', device, **kwargs),
+                   SimSR830('lockin_l', device, **kwargs),
+                   SimSR830('lockin_r', device, **kwargs),
+                   SimKeysight_34465A('keysight_dmm_top', device, **kwargs),
+                   keysight,
+                   SimZIUHFLI('ziuhfli', device, keysight=keysight,
+                              fast_channel=fast_channel, **kwargs),
+                   SimTektronix_AWG5014('AWG1', **kwargs)]
+
+    return qc.Station(*instruments)
@@ -0,0 +1,180 @@
+# Module persisting the station snapshot between kernel restarts
+import json
+import logging
+import os
+import tempfile
+import time
+from fnmatch import fnmatch
+
+from qcodes.instrument.parameter import Parameter
+from qcodes.utils.helpers import NumpyJSONEncoder, full_class
+
+log = logging.getLogger(__name__)
+
+
+def _parameters(instrument):
+    """
+    Return the gettable parameters of an instrument and of its submodules
+    (e.g. the QDac channels) whose value goes into the snapshot, keyed by
+    their full name.
+
+    Like the snapshot, this leaves out array and multi parameters (data
+    buffers, the scope, ...), whose get starts an acquisition, and
+    parameters with snapshot_get or snapshot_value turned off.
+    """
+    params = {}
+
+    for param in instrument.parameters.values():
+        if (isinstance(param, Parameter) and
+                getattr(param, 'has_get', True) and
+                getattr(param, '_snapshot_get', True) and
+                getattr(param, '_snapshot_value', True)):
+            params[param.full_name] = param
+
+    for submodule in getattr(instrument, 'submodules', {}).values():
+        # A ChannelList is iterable, a single channel is not
+        channels = submodule if hasattr(submodule, '__iter__') else [submodule]
+        for channel in channels:
+            params.update(_parameters(channel))
+
+    return params
+
+
+class SnapshotCache:
+    """
+    On-disk cache of the parameter values of the station instruments.
+
+    At startup the cached values are loaded into the parameters, so that
+    the station snapshot (and hence the metadata of every dataset) is
+    available without querying the instruments. Only the parameters that
+    need it are queried:
+        - parameters matching one of the volatile patterns
+        - parameters whose cached value is older than max_age
+        - parameters not in the cache, e.g. of a new instrument
+
+    Entries are keyed by instrument identity (name, class and address), so
+    a different instrument under the same name does not get stale values.
+
+    Args:
+        path (str): The cache file
+        max_age (float): Cached values older than this are refreshed (s)
+        volatile (Sequence[str]): fnmatch patterns of the full names of
+            parameters that are always refreshed, e.g. 'qdac_chan*_v'
+    """
+
+    def __init__(self, path, max_age=24*3600, volatile=()):
+        self.path = path
+        self.max_age = max_age
+        self.volatile = tuple(volatile)
+
+        # identity -> {full_name: {'value': ..., 'ts': epoch}}
+        self._data = {}
+        # full_name -> epoch of the value currently held by the parameter
+        self._ts = {}
+
+        self.load()
+
+    @staticmethod
+    def identity(instrument):
+        """
+        The key of an instrument in the cache
+        """
+        address = getattr(instrument, '_address', '')
+        return '{}|{}|{}'.format(instrument.name, full_class(instrument),
+                                 address)
+
+    def is_volatile(self, full_name):
+        """
+        Whether a parameter is always refreshed
+        """
+        return any(fnmatch(full_name, pat) for pat in self.volatile)
+
+    def load(self):
+        """
+        Load the cache file. A missing or corrupt file gives an empty cache.
+        """
+        try:
+            with open(self.path) as fid:
+                self._data = json.load(fid)
+        except FileNotFoundError:
+            self._data = {}
+        except (OSError, ValueError) as e:
+            log.warning('Ignoring unreadable snapshot cache {}: '
+                        '{}'.format(self.path, e))
+            self._data = {}
+
+    def refresh_instrument(self, instrument):
+        """
+        Load the cached values into the parameters of an instrument and
+        query the parameters that are volatile, stale or not cached.
+
+        Returns:
+            int: The number of queried parameters
+        """
+        entry = self._data.get(self.identity(instrument), {})
+        now = time.time()
+
+        to_query = []
+        for full_name, param in _parameters(instrument).items():
+            cached = entry.get(full_name)
+            if (cached is None or self.is_volatile(full_name) or
+                    now - cached['ts'] > self.max_age):
+                to_query.append((full_name, param))
+            else:
+                param._save_val(cached['value'])
+                self._ts[full_name] = cached['ts']
+
+        for full_name, param in to_query:
+            try:
+                param.get()
+            except Exception as e:
+                log.warning('Could not refresh {}: {}'.format(full_name, e))
+                continue
+            self._ts[full_name] = time.time()
+
+        return len(to_query)
+
+    def refresh(self, station):
+        """
+        Run refresh_instrument for every instrument of a station
+
+        Returns:
+            dict: The number of queried parameters per instrument
+        """
+        return {name: self.refresh_instrument(inst)
+                for name, inst in station.components.items()}
+
+    def save(self, station):
+        """
+        Write the current parameter values of the station to the cache file.
+        The file is replaced atomically.
+        """
+        now = time.time()
+
+        for inst in station.components.values():
+            if not hasattr(inst, 'parameters'):
+                continue
+            entry = {}
+            for full_name, param in _parameters(inst).items():
+                value = param.get_latest()
+                if value is None:
+                    continue
+                try:
+                    json.dumps(value, cls=NumpyJSONEncoder)
+                except (TypeError, ValueError):
+                    continue
+                entry[full_name] = {'value': value,
+                                    'ts': self._ts.get(full_name, now)}
+            self._data[self.identity(inst)] = entry
+
+        content = json.dumps(self._data, cls=NumpyJSONEncoder, indent=1)
+
+        folder = os.path.dirname(os.path.abspath(self.path))
+        fd, tmpname = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as tmpfile:
+                tmpfile.write(content)
+            os.replace(tmpname, self.path)
+        except BaseException:
+            os.remove(tmpname)
+            raise
@@ -0,0 +1,78 @@
+# Script reporting the import time of the modules used by the init scripts
+#
+# Usage: python startup_benchmark.py [module ...]
+#
+# Every module is imported in a fresh interpreter with '-X importtime', so
+# the numbers do not depend on what was imported before. The cumulative
+# time includes everything the module imports itself.
+import subprocess
+import sys
+
+# The modules imported by Experiment_init.py
+DEFAULT_MODULES = ['qcodes',
+                   'matplotlib.pyplot',
+                   'customised_instruments',
+                   'majorana_wrappers',
+                   'reload_settings',
+                   'conductance_measurements',
+                   'fast_diagrams',
+                   'qcodes.instrument_drivers.QDev.QDac_channels',
+                   'qcodes.instrument_drivers.stanford_research.SR830',
+                   'qcodes.instrument_drivers.Keysight.Keysight_33500B',
+                   'qcodes.instrument_drivers.Keysight.Keysight_34465A',
+                   'qcodes.instrument_drivers.ZI.ZIUHFLI',
+                   'qcodes.instrument_drivers.tektronix.Keithley_2600',
+                   'qcodes.instrument_drivers.rohde_schwarz.SGS100A',
+                   'qcodes.instrument_drivers.tektronix.AWG5014',
+                   'qcodes.instrument_drivers.oxford.mercuryiPS',
+                   'qcodes.instrument_drivers.HP.HP8133A',
+                   'qcodes.instrument_drivers.rohde_schwarz.ZNB',
+                   'modules.pulsebuilding.broadbean']
+
+
+def import_time(module):
+    """
+    Import a module in a fresh interpreter.
+
+    Returns:
+        Union[float, None]: The cumulative import time (s) or None if the
+            import failed
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime',
+                           '-c', 'import {}'.format(module)],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+    if proc.returncode != 0:
+        return None
+
+    # Lines look like: 'import time:   self [us] | cumulative | package'
+    for line in proc.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1])*1e-6
+
+    return None
+
+
+def benchmark(modules=DEFAULT_MODULES):
+    """
+    Print a table of the import time of each module, slowest first
+
+    Returns:
+        dict: The import time (s) of each module, None if it failed
+    """
+    times = {module: import_time(module) for module in modules}
+
+    width = max(len(module) for module in modules)
+    for module in sorted(modules, key=lambda m: -(times[m] or 0)):
+        if times[module] is None:
+            timestr = 'failed'
+        else:
+            timestr = '{:.3f} s'.format(times[module])
+        print('{:<{w}}  {:>9}'.format(module, timestr, w=width))
+
+    return times
+
+
+if __name__ == '__main__':
+    benchmark(sys.argv[1:] or DEFAULT_MODULES)
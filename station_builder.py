@@ -0,0 +1,283 @@
+# Module for opening the instruments of a station concurrently
+import logging
+import threading
+import time
+from collections import namedtuple
+from functools import partial
+
+import qcodes as qc
+
+log = logging.getLogger(__name__)
+
+InstrumentTiming = namedtuple('InstrumentTiming',
+                              ['name', 'status', 'open_time', 'snapshot_time'])
+InstrumentTiming.__doc__ = """
+Startup record of a single instrument.
+
+Attributes:
+    name (str): The instrument name
+    status (str): 'ok', 'failed' or 'timeout'
+    open_time (float): Time spent constructing the instrument (s)
+    snapshot_time (float): Time spent querying all its parameters (s)
+"""
+
+
+def run_concurrently(tasks, timeouts, on_late=None):
+    """
+    Run callables concurrently, each on its own daemon thread, and wait
+    for each of them at most its timeout.
+
+    Daemon threads are used so that a hung instrument can neither block
+    the caller beyond its timeout nor the interpreter at exit.
+
+    Args:
+        tasks (dict): Callables keyed by a name
+        timeouts (dict): The timeout (s) for each name
+        on_late (Optional[Callable]): Called as on_late(name, result) on
+            the worker thread when a callable that timed out returns after
+            all, e.g. to close an instrument that opened too late
+
+    Returns:
+        dict: For each name a tuple (status, result, duration) where status
+            is 'ok', 'failed' or 'timeout', result is the return value or
+            the exception and duration the running time (s)
+    """
+    results = {}
+    threads = {}
+    # The names given up on, guarded by lock against the workers
+    abandoned = set()
+    lock = threading.Lock()
+
+    def worker(name, func):
+        t_start = time.perf_counter()
+        try:
+            out = ('ok', func())
+        except Exception as e:
+            out = ('failed', e)
+        with lock:
+            late = name in abandoned
+            if not late:
+                results[name] = out + (time.perf_counter() - t_start,)
+        if late and out[0] == 'ok' and on_late is not None:
+            on_late(name, out[1])
+
+    t_start = time.perf_counter()
+    for name, func in tasks.items():
+        threads[name] = threading.Thread(target=worker, args=(name, func),
+                                         name='{}-worker'.format(name),
+                                         daemon=True)
+        threads[name].start()
+
+    output = {}
+    for name, thread in threads.items():
+        remaining = t_start + timeouts[name] - time.perf_counter()
+        thread.join(max(remaining, 0))
+        with lock:
+            if name in results:
+                output[name] = results[name]
+            else:
+                abandoned.add(name)
+                output[name] = ('timeout', None,
+                                time.perf_counter() - t_start)
+
+    return output
+
+
+def print_timing_table(report):
+    """
+    Print the startup report of build_station as a table
+
+    Args:
+        report (list): List of InstrumentTiming
+    """
+    width = max([len(rec.name) for rec in report] + [10])
+    print('{:<{w}}  {:>8}  {:>12}  {:>8}'.format('Instrument', 'Open (s)',
+                                                  'Snapshot (s)', 'Status',
+                                                  w=width))
+    for rec in report:
+        print('{:<{w}}  {:>8.2f}  {:>12.2f}  {:>8}'.format(rec.name,
+                                                           rec.open_time,
+                                                           rec.snapshot_time,
+                                                           rec.status,
+                                                           w=width))
+
+
+def build_station(factories, timeout=60, timeouts=None,
+                  update_snapshot=True, snapshot_cache=None,
+                  allow_failures=False, print_timings=True):
+    """
+    Open instruments and snapshot them concurrently, then make a Station.
+
+    Most of the startup time of a station is spent waiting on separate
+    GPIB, serial and TCPIP links, so the total time is set by the slowest
+    instrument rather than by the sum of all of them. Instruments sharing
+    a bus (e.g. the lock-ins on GPIB10) are still serialised by the bus.
+
+    Example:
+        station, report = build_station(
+            {'qdac': partial(QDAC_T10, 'qdac', 'ASRL8::INSTR', config),
+             'lockin_topo': partial(SR830_T10, 'lockin_topo',
+                                    'GPIB10::7::INSTR')})
+
+    Args:
+        factories (dict): Callables returning the instruments, keyed by
+            the instrument name. The station keeps this order.
+        timeout (float): Default timeout for opening and for snapshotting
+            an instrument (s)
+        timeouts (Optional[dict]): Per-instrument timeouts overriding the
+            default
+        update_snapshot (bool): Query all parameters of the instruments.
+            The snapshot the station makes afterwards then only uses the
+            cached values. Default: True.
+        snapshot_cache (Optional[SnapshotCache]): If given, the parameter
+            values are taken from this on-disk cache, and only volatile,
+            stale and uncached parameters are queried. The cache is saved
+            once the station is made. Overrides update_snapshot.
+        allow_failures (bool): If False, raise a RuntimeError if any
+            instrument failed or timed out. Else leave those instruments
+            out of the station. Default: False. Either way, the opened
+            instruments that are not in the station are closed, also those
+            that open after their timeout, so that the next attempt can
+            use their names.
+        print_timings (bool): Print a table of the timings. Default: True.
+
+    Returns:
+        tuple: (Station, list of InstrumentTiming)
+    """
+    limits = dict.fromkeys(factories, timeout)
+    limits.update(timeouts or {})
+
+    def close_late(name, instrument):
+        log.warning('{} opened after its timeout, closing it'.format(name))
+        _discard_instrument(instrument)
+
+    opened = run_concurrently(factories, limits, on_late=close_late)
+    instruments = {name: res for name, (status, res, _) in opened.items()
+                   if status == 'ok'}
+    # The instruments to close if they do not make it into the station
+    unused = dict(instruments)
+
+    snapshotted = {}
+    if snapshot_cache is not None:
+        tasks = {name: partial(snapshot_cache.refresh_instrument, inst)
+                 for name, inst in instruments.items()}
+        snapshotted = run_concurrently(tasks, limits)
+    elif update_snapshot:
+        tasks = {name: partial(inst.snapshot, update=True)
+                 for name, inst in instruments.items()}
+        snapshotted = run_concurrently(tasks, limits)
+
+    report = []
+    for name, (status, res, open_time) in opened.items():
+        snapshot_time = 0.0
+        if name in snapshotted:
+            status, snap_res, snapshot_time = snapshotted[name]
+            if status != 'ok':
+                res = snap_res
+                instruments.pop(name)
+        if status == 'failed':
+            log.error('Could not start {}: {}'.format(name, res))
+        elif status == 'timeout':
+            log.error('Timed out starting {}'.format(name))
+        report.append(InstrumentTiming(name, status, open_time,
+                                       snapshot_time))
+
+    if print_timings:
+        print_timing_table(report)
+
+    bad = [rec.name for rec in report if rec.status != 'ok']
+    if bad and not allow_failures:
+        close_instruments(unused)
+        raise RuntimeError('Could not start the instruments: '
+                           '{}'.format(', '.join(bad)))
+
+    for name in instruments:
+        unused.pop(name)
+    if unused:
+        close_instruments(unused)
+
+    station = qc.Station(*instruments.values(), update_snapshot=False)
+
+    if snapshot_cache is not None:
+        snapshot_cache.save(station)
+
+    return station, report
+
+
+def close_station(station, timeout=10, timeouts=None):
+    """
+    Close all instruments of a station in parallel.
+
+    An instrument that does not close within its timeout is left to its
+    (daemon) thread and removed from the instrument registry, so that it
+    neither blocks the shutdown nor the next startup under the same name.
+
+    Args:
+        station (Station): The station to close
+        timeout (float): Default timeout for closing an instrument (s)
+        timeouts (Optional[dict]): Per-instrument timeouts overriding the
+            default
+
+    Returns:
+        dict: The status of each instrument: 'ok', 'failed' or 'timeout'
+    """
+    instruments = {}
+    for comp in station.components:
+        try:
+            instruments[comp] = qc.Instrument.find_instrument(comp)
+        except KeyError:
+            pass
+
+    return close_instruments(instruments, timeout, timeouts)
+
+
+def close_instruments(instruments, timeout=10, timeouts=None):
+    """
+    Close instruments in parallel, see close_station
+
+    Args:
+        instruments (dict): The instruments keyed by name
+        timeout (float): Default timeout for closing an instrument (s)
+        timeouts (Optional[dict]): Per-instrument timeouts overriding the
+            default
+
+    Returns:
+        dict: The status of each instrument: 'ok', 'failed' or 'timeout'
+    """
+    limits = dict.fromkeys(instruments, timeout)
+    limits.update(timeouts or {})
+
+    tasks = {name: inst.close for name, inst in instruments.items()}
+    results = run_concurrently(tasks, limits)
+
+    status = {}
+    for name, (stat, res, duration) in results.items():
+        status[name] = stat
+        if stat == 'ok':
+            print('Closed connection to {} ({:.2f} s)'.format(name,
+                                                             duration))
+            continue
+        if stat == 'failed':
+            print('Failed to close {}: {}'.format(name, res))
+        else:
+            print('Gave up closing {} after {:.0f} s'.format(name, duration))
+        try:
+            type(instruments[name]).remove_instance(instruments[name])
+        except Exception:
+            pass
+
+    return status
+
+
+def _discard_instrument(instrument):
+    """
+    Close an instrument, or at least remove it from the registry
+    """
+    try:
+        instrument.close()
+    except Exception:
+        log.exception('Failed to close {}'.format(instrument.name))
+        try:
+            type(instrument).remove_instance(instrument)
+        except Exception:
+            pass
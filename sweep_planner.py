@@ -0,0 +1,241 @@
+# Module planning the time per point of QDac-driven sweeps
+#
+# With a slope assigned, setting a QDac channel starts a ramp and returns
+# at once. The lock-in starts settling while the channel ramps, so the
+# time per point is set by whichever takes longer, not by their sum.
+import logging
+import time
+from collections import namedtuple
+
+import numpy as np
+import qcodes as qc
+from qcodes.instrument.parameter import ArrayParameter
+from qcodes.utils.wrappers import do1d, _do_measurement
+
+from customised_instruments import SR830_T10
+from majorana_wrappers import prepare_qdac, wait_for_qdac_ramp
+
+log = logging.getLogger(__name__)
+
+# Time to settle to 99 % after a step, in time constants, for each SR830
+# filter slope (dB/oct)
+SR830_SETTLE_TAUS = {6: 5, 12: 7, 18: 9, 24: 10}
+
+
+SweepSchedule = namedtuple('SweepSchedule',
+                           ['ramp_time', 'settle_time', 'post_ramp_time',
+                            'acquisition_time', 'delay', 'point_time'])
+SweepSchedule.__doc__ = """
+The per-point schedule of a sweep, see plan_sweep. All times in s.
+
+Attributes:
+    ramp_time (float): The time the QDac needs for one step
+    settle_time (float): The time the measurement needs to settle after a
+        step, counted from the start of the step
+    post_ramp_time (float): The minimal time between the end of a ramp and
+        the acquisition
+    acquisition_time (float): The time to acquire the measured parameters
+    delay (float): The Loop delay: max(ramp + post ramp, settle)
+    point_time (float): The total time per point: delay + acquisition
+"""
+
+
+def plan_sweep(start, stop, n_points, slope=None, settle_time=0,
+               post_ramp_time=0, acquisition_time=0):
+    """
+    Combine the ramp, settle and acquisition times into the shortest time
+    per point.
+
+    Args:
+        start (float): Start of the sweep
+        stop (float): End of the sweep
+        n_points (int): The number of points
+        slope (Union[float, str, None]): The QDac slope (V/s). None or
+            'Inf' for a step without ramp.
+        settle_time (float): The settle time of the measurement after a
+            step (s), e.g. lockin_settle_time(lockin)
+        post_ramp_time (float): The minimal time after the end of a ramp
+            (s)
+        acquisition_time (float): The time to acquire a point (s), e.g.
+            acquisition_time(*inst_meas)
+
+    Returns:
+        SweepSchedule: The schedule
+    """
+    if slope in (None, 'Inf') or n_points < 2:
+        ramp_time = 0.0
+    else:
+        ramp_time = abs(stop-start)/(n_points-1)/slope
+
+    delay = max(ramp_time + post_ramp_time, settle_time)
+
+    return SweepSchedule(ramp_time, settle_time, post_ramp_time,
+                         acquisition_time, delay, delay + acquisition_time)
+
+
+def lockin_settle_time(lockin):
+    """
+    The time an SR830 needs to settle to 99 % after a step, from its time
+    constant and filter slope (s). Both are queried if not cached.
+    """
+    n_taus = SR830_SETTLE_TAUS[SR830_T10.cached(lockin.filter_slope)]
+    return n_taus*SR830_T10.cached(lockin.time_constant)
+
+
+def acquisition_time(*inst_meas, repetitions=3):
+    """
+    The time to get all parameters once (s). Scalar parameters take the
+    fastest of a few repetitions, array parameters (e.g. lock-in buffers)
+    are read only once, as every readout is slow and changes the buffer.
+    """
+    arrays = [param for param in inst_meas
+              if isinstance(param, ArrayParameter)]
+    scalars = [param for param in inst_meas
+               if not isinstance(param, ArrayParameter)]
+
+    t0 = time.perf_counter()
+    for param in arrays:
+        param.get()
+    array_time = time.perf_counter() - t0
+
+    times = []
+    for _ in range(repetitions if scalars else 0):
+        t0 = time.perf_counter()
+        for param in scalars:
+            param.get()
+        times.append(time.perf_counter() - t0)
+
+    return array_time + min(times, default=0.0)
+
+
+def _report(schedule, n_points, elapsed):
+    """
+    Print and return the achieved points per second
+    """
+    rate = n_points/elapsed
+    print('{} points in {:.1f} s: {:.2f} points/s (planned {:.2f} '
+          'points/s)'.format(n_points, elapsed, rate,
+                             1/schedule.point_time if schedule.point_time
+                             else np.inf))
+    return rate
+
+
+def _qdac_channel(param):
+    """
+    The QDac channel of a voltage parameter, None for other parameters
+    """
+    chan = getattr(param, '_instrument', None)
+    if chan is not None and hasattr(chan, 'slope'):
+        return chan
+    return None
+
+
+def _schedule(inst_set, start, stop, n_points, inst_meas, lockin, settle_time,
+              post_ramp_time, ramp_slope):
+    """
+    Prepare the QDac channel (if any) and plan the schedule of a sweep
+    """
+    if settle_time is None:
+        settle_time = lockin_settle_time(lockin) if lockin is not None else 0
+
+    slope = None
+    chan = _qdac_channel(inst_set)
+    if chan is not None:
+        # Ramps to the start and leaves the slope assigned for the sweep
+        _, slope = prepare_qdac(chan, start, stop, n_points, 0, ramp_slope)
+
+    return plan_sweep(start, stop, n_points, slope=slope,
+                      settle_time=settle_time, post_ramp_time=post_ramp_time,
+                      acquisition_time=acquisition_time(*inst_meas))
+
+
+def do1d_planned(inst_set, start, stop, n_points, *inst_meas, lockin=None,
+                 settle_time=None, post_ramp_time=0, ramp_slope=None):
+    """
+    do1d with the shortest delay per point: the QDac ramps each step at
+    its slope while the measurement settles, see plan_sweep. Prints the
+    schedule and the achieved points per second.
+
+    Args:
+        inst_set: Parameter to sweep over
+        start: Start of sweep
+        stop: End of sweep
+        n_points: The number of points
+        *inst_meas: The parameters to measure
+        lockin: The SR830 whose time constant sets the settle time
+        settle_time: The settle time (s). Default: from the lockin, 0
+            without lockin
+        post_ramp_time: The minimal time after the end of a ramp (s)
+        ramp_slope: The QDac slope (V/s). Default: from the config file
+
+    Returns:
+        plot, data, schedule : the plot, the dataset and the SweepSchedule
+    """
+    schedule = _schedule(inst_set, start, stop, n_points, inst_meas, lockin,
+                         settle_time, post_ramp_time, ramp_slope)
+    log.info('Sweep schedule: {}'.format(schedule))
+
+    chan = _qdac_channel(inst_set)
+    t0 = time.perf_counter()
+    try:
+        plot, data = do1d(inst_set, start, stop, n_points, schedule.delay,
+                          *inst_meas)
+    finally:
+        if chan is not None:
+            chan.slope('Inf')
+    _report(schedule, n_points, time.perf_counter() - t0)
+
+    return plot, data, schedule
+
+
+def do2d_planned(inst_set, start, stop, n_points, delay, inst_set2, start2,
+                 stop2, n_points2, *inst_meas, lockin=None, settle_time=None,
+                 post_ramp_time=0, ramp_slope=None):
+    """
+    do2d with the shortest delay per point of the inner sweep, see
+    do1d_planned. The outer sweep uses the given delay. Before every row,
+    we wait for the inner channel to ramp back to start2, for as long as
+    the distance from its last value takes.
+
+    Returns:
+        plot, data, schedule : the plot, the dataset and the SweepSchedule
+            of the inner sweep
+    """
+    schedule = _schedule(inst_set2, start2, stop2, n_points2, inst_meas,
+                         lockin, settle_time, post_ramp_time, ramp_slope)
+    log.info('Sweep schedule: {}'.format(schedule))
+
+    chan = _qdac_channel(inst_set2)
+
+    def return_to_start():
+        if chan is None:
+            return
+        # The first row starts where prepare_qdac left the channel
+        current = inst_set2.get_latest()
+        if current is None:
+            fraction = 1
+        elif stop2 == start2:
+            fraction = 0
+        else:
+            fraction = abs(current - start2)/abs(stop2 - start2)
+        inst_set2.set(start2)
+        wait_for_qdac_ramp({chan: start2},
+                           fraction*schedule.ramp_time*(n_points2-1))
+
+    inner_loop = qc.Loop(inst_set2.sweep(start2, stop2, num=n_points2),
+                         schedule.delay).each(*inst_meas)
+    outer_loop = qc.Loop(inst_set.sweep(start, stop, num=n_points),
+                         delay).each(qc.Task(return_to_start), inner_loop)
+    set_params = ((inst_set, start, stop),
+                  (inst_set2, start2, stop2))
+
+    t0 = time.perf_counter()
+    try:
+        plot, data = _do_measurement(outer_loop, set_params, inst_meas,
+                                     do_plots=True)
+    finally:
+        if chan is not None:
+            chan.slope('Inf')
+    _report(schedule, n_points*n_points2, time.perf_counter() - t0)
+
+    return plot, data, schedule
@@ -0,0 +1,192 @@
+# Regression tests running measurements end to end on the simulated
+# instruments. Run with: python -m pytest test_simulated_instruments.py
+import os
+import shutil
+import threading
+import time
+from functools import partial
+
+import numpy as np
+import pytest
+import qcodes as qc
+
+from config_watcher import ConfigWatcher
+from configreader import Config, QDAC_N_CHANNELS
+from customised_instruments import LockinGroup
+from reload_settings import reload_QDAC_settings, reload_SR830_settings
+from simulated_instruments import (SimulatedDevice, SimKeysight_33500B,
+                                   simulated_station)
+from station_builder import build_station
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'sample.config')
+
+
+@pytest.fixture
+def device():
+    # Without noise, the measured conductance is exactly the model's
+    return SimulatedDevice(noise=0, seed=0)
+
+
+@pytest.fixture
+def station(device):
+    config = Config(CONFIG_FILE)
+    station = simulated_station(config, device=device, latency=0)
+    reload_QDAC_settings()
+    reload_SR830_settings()
+
+    yield station
+
+    for instrument in list(station.components.values()):
+        instrument.close()
+
+
+def test_loop_sweep(station, device, tmpdir):
+    gate = station['qdac'].ch05.v
+    lockin = station['lockin_topo']
+    setpoints = np.linspace(0, 0.05, 51)
+
+    loop = qc.Loop(gate.sweep(0, 0.05, num=51)).each(lockin.g)
+    data = loop.get_data_set(io=qc.DiskIO(str(tmpdir)))
+    loop.run(quiet=True)
+
+    voltages = np.zeros((len(setpoints), QDAC_N_CHANNELS+1))
+    voltages[:, 5] = setpoints
+    expected = device.conductance(voltages)
+
+    np.testing.assert_allclose(data.arrays[gate.full_name + '_set'],
+                               setpoints)
+    np.testing.assert_allclose(data.arrays[lockin.g.full_name], expected,
+                               rtol=1e-6)
+    # The sweep crosses Coulomb peaks
+    assert np.ptp(expected) > 0.5
+
+
+def test_hardware_sweep(station):
+    # The measurement wrappers come with the QDev fork of qcodes
+    pytest.importorskip('qcodes.utils.wrappers')
+    from hardware_sweeps import QDacRampSweep
+
+    chan = station['qdac'].ch05
+    lockin = station['lockin_topo']
+
+    sweep = QDacRampSweep('sweep', chan, lockin.conductance, 0, 0.05, 51,
+                          sample_rate=256)
+    first = sweep.get()
+    second = sweep.get()
+
+    for data in (first, second):
+        assert data.shape == (51,)
+        assert np.isfinite(data).all()
+        assert data.max() > 0.5
+    # The buffer is prepared once and keeps its unit
+    assert lockin.conductance.unit == 'e^2/h'
+    assert chan.slope.get() == 'Inf'
+
+
+def test_fast_axis(station):
+    keysight = station['keysight_gen_left']
+    zi = station['ziuhfli']
+
+    keysight.ch1_amplitude(0.05)
+    signal, _ = zi.Scope.get()
+
+    # The ramp on the fast channel sweeps the trace across a peak
+    assert np.ptp(signal[0]) > 0.5e-3
+
+
+def test_qdac_io_lock(station):
+    qdac = station['qdac']
+    locked = threading.Event()
+
+    def hold_lock():
+        with qdac.io_lock:
+            locked.set()
+            time.sleep(0.1)
+
+    thread = threading.Thread(target=hold_lock)
+    thread.start()
+    locked.wait()
+    # The status query waits until the other thread is done
+    t_start = time.perf_counter()
+    qdac.ch05.v.get()
+    thread.join()
+    assert time.perf_counter() - t_start >= 0.1
+
+
+def test_do2d_snake(station, device, tmpdir):
+    pytest.importorskip('qcodes.utils.wrappers')
+    from majorana_wrappers import do2d_M
+
+    qc.init(str(tmpdir), 'simulated', station, display_pdf=False,
+            display_individual_pdf=False)
+    qdac = station['qdac']
+    lockin = station['lockin_topo']
+
+    plot, data = do2d_M(qdac.ch05.v, 0, 0.02, 3, 0, qdac.ch06.v, 0, 0.03, 4,
+                        0, lockin.g, snake=True)
+
+    voltages = np.zeros((3, 4, QDAC_N_CHANNELS+1))
+    voltages[..., 5] = np.linspace(0, 0.02, 3)[:, np.newaxis]
+    voltages[..., 6] = np.linspace(0, 0.03, 4)
+    # Every other row is measured backwards, but stored in setpoint order
+    np.testing.assert_allclose(data.arrays[lockin.g.full_name],
+                               device.conductance(voltages), rtol=1e-6)
+
+
+def test_lockin_group(station, device):
+    lockins = LockinGroup('lockins', [station['lockin_topo'],
+                                      station['lockin_l']])
+    gate = station['qdac'].ch05.v
+    gate.set(0.01)
+
+    voltages = np.zeros(QDAC_N_CHANNELS+1)
+    voltages[5] = 0.01
+    expected = device.conductance(voltages)
+
+    # The arrays are named after the instrument of the group
+    assert lockins.full_names == ['lockin_topo_lockin_topo_g',
+                                  'lockin_topo_lockin_l_g']
+    np.testing.assert_allclose(lockins.get(), (expected, expected),
+                               rtol=1e-6)
+
+
+def test_build_station_failure_closes_instruments():
+    def broken():
+        raise RuntimeError('no connection')
+
+    def slow():
+        time.sleep(0.2)
+        return SimKeysight_33500B('slow_gen', latency=0)
+
+    factories = {'gen': partial(SimKeysight_33500B, 'gen', latency=0),
+                 'broken': broken,
+                 'slow': slow}
+    with pytest.raises(RuntimeError):
+        build_station(factories, timeouts={'slow': 0.05},
+                      update_snapshot=False, print_timings=False)
+
+    # Neither the opened instrument nor the one opening too late is left
+    time.sleep(0.3)
+    for name in ('gen', 'slow_gen'):
+        with pytest.raises(KeyError):
+            qc.Instrument.find_instrument(name)
+
+
+def test_config_watcher_skips_transactions(station, tmpdir):
+    filename = str(tmpdir.join('sample.config'))
+    shutil.copy(CONFIG_FILE, filename)
+    config = Config(filename, isdefault=False)
+    watcher = ConfigWatcher(config, station)
+    watcher._current = config.snapshot
+    lockin = station['lockin_topo']
+    ivgain = lockin.ivgain
+
+    with config.transaction():
+        config.set('Gain settings', 'iv topo gain', 2e7)
+        watcher._update()
+        # The uncommitted gain is not pushed to the lock-in
+        assert lockin.ivgain == ivgain
+
+    watcher._update()
+    assert lockin.ivgain == 2e7
@@ -0,0 +1,257 @@
+# Module for virtual gates: linear combinations of QDac channel voltages
+# compensating the cross-capacitances between gates
+import re
+
+import numpy as np
+import qcodes as qc
+from qcodes.instrument.parameter import Parameter
+
+from majorana_wrappers import move_gates
+
+
+class VirtualGateMatrix:
+    """
+    A set of virtual gates defined by a matrix on a set of QDac channels:
+
+        virtual = matrix @ real
+
+    where real are the voltages of the channels. Row i of the matrix is
+    virtual gate i, so the identity matrix gives virtual gates equal to the
+    real ones, and off-diagonal elements compensate cross-capacitances.
+
+    Every virtual gate is a parameter (see VirtualGateParameter), available
+    as virtual_gates[name]. Setting it changes the real gates such that the
+    other virtual gates stay constant.
+
+    The conversions work on whole arrays of gate vectors (last axis), e.g.
+    to compute the real voltages of every point of a scan at once.
+
+    Args:
+        channels (Sequence[int]): The QDac channel numbers of the gates
+        matrix (Optional[array-like]): The N x N matrix. Default: identity
+        names (Optional[Sequence[str]]): The names of the virtual gates.
+            Default: 'virtual_' + the channel label
+        qdac (Optional[QDAC_T10]): Default: the station qdac
+    """
+
+    def __init__(self, channels, matrix=None, names=None, qdac=None):
+        self.channels = [int(ch) for ch in channels]
+        self._qdac = qdac
+        if matrix is None:
+            matrix = np.eye(len(self.channels))
+        self.matrix = matrix
+
+        if names is None:
+            names = ['virtual_{}'.format(self.qdac.channels[ch-1].v.label)
+                     for ch in self.channels]
+        if len(names) != len(self.channels):
+            raise ValueError('Need one name per channel')
+
+        self.parameters = {}
+        for index, name in enumerate(names):
+            self.parameters[name] = VirtualGateParameter(name, self, index)
+
+    @property
+    def qdac(self):
+        if self._qdac is None:
+            return qc.Station.default['qdac']
+        return self._qdac
+
+    @property
+    def matrix(self):
+        return self._matrix
+
+    @matrix.setter
+    def matrix(self, matrix):
+        matrix = np.array(matrix, dtype=float)
+        n = len(self.channels)
+        if matrix.shape != (n, n):
+            raise ValueError('The matrix must be {0} x {0}, not '
+                             '{1}'.format(n, matrix.shape))
+        try:
+            inverse = np.linalg.inv(matrix)
+        except np.linalg.LinAlgError:
+            raise ValueError('The virtual gate matrix is singular')
+
+        matrix.setflags(write=False)
+        inverse.setflags(write=False)
+        self._matrix = matrix
+        self._inverse = inverse
+
+    def __getitem__(self, name):
+        return self.parameters[name]
+
+    def index(self, name):
+        """
+        The index of a virtual gate
+        """
+        return self.parameters[name].index
+
+    def to_virtual(self, real):
+        """
+        Convert real gate voltages to virtual ones
+
+        Args:
+            real (array-like): Shape (..., N)
+
+        Returns:
+            numpy.ndarray: Shape (..., N)
+        """
+        return np.asarray(real, dtype=float) @ self._matrix.T
+
+    def to_real(self, virtual):
+        """
+        Convert virtual gate voltages to real ones
+
+        Args:
+            virtual (array-like): Shape (..., N)
+
+        Returns:
+            numpy.ndarray: Shape (..., N)
+        """
+        return np.asarray(virtual, dtype=float) @ self._inverse.T
+
+    def real_voltages(self, cached=False):
+        """
+        The voltages of the real gates
+
+        Args:
+            cached (bool): Use the cached channel values instead of
+                querying the QDac status
+        """
+        if cached:
+            return np.array([self.qdac.channels[ch-1].v.get_latest()
+                             for ch in self.channels], dtype=float)
+        return self.qdac.get_voltages()[self.channels]
+
+    def virtual_voltages(self, cached=False):
+        """
+        The voltages of the virtual gates
+        """
+        return self.to_virtual(self.real_voltages(cached))
+
+    def real_grid(self, axes, virtual=None):
+        """
+        The real gate voltages of a scan of virtual gates, with the other
+        virtual gates at their present value.
+
+        Args:
+            axes (Sequence[Tuple[str, array-like]]): The (name, setpoints)
+                of each scanned virtual gate, outermost first
+            virtual (Optional[array-like]): The virtual gate voltages of
+                the gates not scanned. Default: the present ones
+
+        Returns:
+            numpy.ndarray: Shape (len(setpoints1), len(setpoints2), ..., N)
+        """
+        if virtual is None:
+            virtual = self.virtual_voltages()
+        setpoints = [np.asarray(values, dtype=float) for _, values in axes]
+        grid = np.broadcast_to(virtual, tuple(len(v) for v in setpoints) +
+                               (len(self.channels),)).copy()
+        for (name, _), values in zip(axes, np.meshgrid(*setpoints,
+                                                       indexing='ij')):
+            grid[..., self.index(name)] = values
+
+        return self.to_real(grid)
+
+    def validate(self, real):
+        """
+        Check that real gate voltages (shape (..., N)) are within the
+        ranges of the QDac channels
+
+        Raises:
+            ValueError: If any voltage is out of range
+        """
+        low, high = self.qdac.ranges[self.channels].T
+        real = np.asarray(real)
+        invalid = ~((real >= low) & (real <= high))
+        if invalid.any():
+            bad = sorted({self.channels[i]
+                          for i in np.flatnonzero(invalid.any(
+                              axis=tuple(range(real.ndim-1))))})
+            raise ValueError('The virtual gate scan leaves the range of '
+                             'QDac channel(s) {}'.format(bad))
+
+    def compensation(self, gate, other):
+        """
+        The change of the real gate 'other' per change of the real gate
+        'gate' when sweeping the virtual gate in the row of 'gate'.
+
+        E.g. for a fast charge diagram with the Keysight ramp added to the
+        'gate' channel, the compensating ramp on the 'other' channel has
+        compensation(gate, other) times the amplitude.
+
+        Args:
+            gate (int): The QDac channel of the swept gate
+            other (int): The QDac channel of the compensating gate
+        """
+        i = self.channels.index(gate)
+        j = self.channels.index(other)
+        return self._inverse[j, i]/self._inverse[i, i]
+
+
+class VirtualGateParameter(Parameter):
+    """
+    A virtual gate of a VirtualGateMatrix. Setting it writes all real
+    gates with one QDAC_T10.set_voltages call, keeping the other virtual
+    gates constant. Can be swept like any other parameter.
+
+    Args:
+        name (str): The name of the virtual gate
+        gates (VirtualGateMatrix): The matrix it belongs to
+        index (int): The row of the matrix
+    """
+
+    def __init__(self, name, gates, index, **kwargs):
+        super().__init__(name, label=name, unit='V', **kwargs)
+        self.gates = gates
+        self.index = index
+
+    def get(self):
+        value = float(self.gates.virtual_voltages()[self.index])
+        self._save_val(value)
+        return value
+
+    def set(self, value):
+        virtual = self.gates.virtual_voltages(cached=True)
+        virtual[self.index] = value
+        real = self.gates.to_real(virtual)
+        self.gates.validate(real)
+
+        self.gates.qdac.set_voltages(dict(zip(self.gates.channels, real)))
+        self._save_val(value)
+
+    def ramp_to(self, value):
+        """
+        Move to a value along a straight line at the configured slopes
+        (see majorana_wrappers.move_gates)
+        """
+        virtual = self.gates.virtual_voltages()
+        virtual[self.index] = value
+        real = self.gates.to_real(virtual)
+        self.gates.validate(real)
+
+        move_gates(dict(zip(self.gates.channels, real)),
+                   qdac=self.gates.qdac)
+        self._save_val(value)
+
+    def validate_sweep(self, values, *others):
+        """
+        Check a whole scan against the channel ranges before it starts.
+
+        Args:
+            values (array-like): The setpoints of this gate
+            *others (Tuple[VirtualGateParameter, array-like]): Setpoints
+                of other virtual gates of the same matrix
+        """
+        axes = [(self.name, values)]
+        axes += [(param.name, vals) for param, vals in others]
+        self.gates.validate(self.gates.real_grid(axes))
+
+
+def qdac_channel_number(param):
+    """
+    The QDac channel number of a channel voltage parameter
+    """
+    return int(re.findall('\d+', param._instrument.name)[0])